@@ -1,9 +1,176 @@
+import datetime
+
 from django.contrib import admin
+from django.contrib.admin.actions import delete_selected
+from django.contrib.admin.options import IS_POPUP_VAR
+from django.contrib.admin.templatetags.admin_urls import add_preserved_filters
+from django.contrib.auth import get_permission_codename
+from django.core.exceptions import PermissionDenied
+from django.db.models import Max, Min, QuerySet
+from django.http import HttpResponseRedirect
+from django.urls import reverse
+from django.utils import timezone
+
+from .cache import group_choices
+from .deletion import dependent_models, schedule_deletion
+from .models import Comment, DeletionJob, Group, Post
+from .paginators import EstimatedCountPaginator
+from .search import search_posts
+
+
+class DateBoundsQuerySet(QuerySet):
+    """datetimes() по MIN/MAX выборки вместо SELECT DISTINCT.
+
+    date_hierarchy строит ссылки на годы, месяцы и дни через
+    datetimes(); на миллионах строк это полный проход по таблице.
+    Границы берутся из индекса, а периоды между ними перечисляются
+    в Python — ссылки на пустые периоды допустимы.
+    """
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None):
+        bounds = self.aggregate(first=Min(field_name), last=Max(field_name))
+        if bounds['first'] is None:
+            return []
+        first, last = bounds['first'], bounds['last']
+        if timezone.is_aware(first):
+            tzinfo = tzinfo or timezone.get_current_timezone()
+            first = timezone.localtime(first, tzinfo)
+            last = timezone.localtime(last, tzinfo)
+        periods = []
+        current = first.date().replace(
+            month=first.month if kind != 'year' else 1,
+            day=first.day if kind == 'day' else 1,
+        )
+        while current <= last.date():
+            periods.append(current)
+            if kind == 'year':
+                current = current.replace(year=current.year + 1)
+            elif kind == 'month':
+                current = (current + datetime.timedelta(days=31)).replace(
+                    day=1
+                )
+            else:
+                current += datetime.timedelta(days=1)
+        periods = [
+            datetime.datetime.combine(period, datetime.time())
+            for period in periods
+        ]
+        if timezone.is_aware(first):
+            periods = [
+                timezone.make_aware(period, tzinfo) for period in periods
+            ]
+        return periods if order == 'ASC' else periods[::-1]
+
+
+class ScaleModeAdmin(admin.ModelAdmin):
+    """Список объектов, который не замедляется с ростом таблицы.
+
+    Число строк берётся оценкой (см. counters.estimated_count), полный
+    COUNT(*) под фильтрами не выполняется, связанные колонки приходят
+    одним JOIN, а date_hierarchy не сканирует таблицу.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return DateBoundsQuerySet(
+            model=queryset.model, query=queryset.query, using=queryset.db
+        )
+
+
+def queue_deletion(modeladmin, request, queryset):
+    """delete_selected, который ставит объекты в очередь удаления и
+    сообщает только об этом."""
+    if not request.POST.get('post'):
+        # страница подтверждения — как у обычного действия
+        return delete_selected(modeladmin, request, queryset)
+    perms_needed = modeladmin.get_deleted_objects(queryset, request)[2]
+    if perms_needed:
+        raise PermissionDenied
+    count = 0
+    for obj in queryset:
+        modeladmin.log_deletion(request, obj, str(obj))
+        count += 1
+    modeladmin.delete_queryset(request, queryset)
+    modeladmin.message_user(
+        request, f'Удаление объектов ({count}) поставлено в очередь.'
+    )
+    return None
+
+
+queue_deletion.allowed_permissions = ('delete',)
+queue_deletion.short_description = 'Удалить выбранные %(verbose_name_plural)s'
+
+
+class ChunkedDeleteAdmin(admin.ModelAdmin):
+    """Удаление через DeletionJob: зависимые строки удаляются фоном
+    пачками, а страница подтверждения не собирает их в память."""
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        if 'delete_selected' in actions:
+            # имя прежнее: его отправляет шаблон подтверждения
+            actions['delete_selected'] = (
+                queue_deletion,
+                'delete_selected',
+                queue_deletion.short_description
+            )
+        return actions
+
+    def get_deleted_objects(self, objs, request):
+        # права на зависимые модели проверяются, как у обычного удаления,
+        # но без обхода всех строк
+        models = set()
+        for obj in objs:
+            models |= dependent_models(obj)
+        perms_needed = {
+            model._meta.verbose_name for model in models
+            if not self.can_delete(request, model)
+        }
+        return [str(obj) for obj in objs], {}, perms_needed, []
+
+    def can_delete(self, request, model):
+        model_admin = self.admin_site._registry.get(model)
+        if model_admin is not None:
+            return model_admin.has_delete_permission(request)
+        opts = model._meta
+        return request.user.has_perm(
+            f'{opts.app_label}.{get_permission_codename("delete", opts)}'
+        )
 
-from .models import Group, Post
+    def delete_model(self, request, obj):
+        schedule_deletion(obj)
 
+    def delete_queryset(self, request, queryset):
+        for obj in queryset.iterator():
+            schedule_deletion(obj)
 
-class PostAdmin(admin.ModelAdmin):
+    def response_delete(self, request, obj_display, obj_id):
+        if IS_POPUP_VAR in request.POST:
+            return super().response_delete(request, obj_display, obj_id)
+        # вместо «успешно удалён»: объект пока на месте
+        self.message_user(
+            request, f'Удаление «{obj_display}» поставлено в очередь.'
+        )
+        opts = self.model._meta
+        if self.has_change_permission(request, None):
+            post_url = add_preserved_filters(
+                {
+                    'preserved_filters': self.get_preserved_filters(request),
+                    'opts': opts
+                },
+                reverse(
+                    f'admin:{opts.app_label}_{opts.model_name}_changelist',
+                    current_app=self.admin_site.name
+                )
+            )
+        else:
+            post_url = reverse('admin:index', current_app=self.admin_site.name)
+        return HttpResponseRedirect(post_url)
+
+
+class PostAdmin(ChunkedDeleteAdmin, ScaleModeAdmin):
     list_display = (
         'pk',
         'text',
@@ -12,10 +179,64 @@ class PostAdmin(admin.ModelAdmin):
         'group',
     )
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
+    raw_id_fields = ('author',)
     search_fields = ('text',)
     list_filter = ('pub_date',)
+    date_hierarchy = 'pub_date'
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # полнотекстовый индекс вместо LIKE '%…%' по всей таблице
+        if not search_term.strip():
+            return queryset, False
+        found = search_posts(search_term).order_by().values('pk')
+        return queryset.filter(pk__in=found), False
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_foreignkey(
+            db_field, request, **kwargs
+        )
+        if db_field.name == 'group':
+            # без этого list_editable запрашивает группы для каждой строки
+            formfield.choices = [
+                ('', formfield.empty_label), *group_choices()
+            ]
+        return formfield
+
+
+class CommentAdmin(ScaleModeAdmin):
+    list_display = (
+        'pk',
+        'text',
+        'created',
+        'author',
+        'post',
+    )
+    list_select_related = ('author', 'post')
+    raw_id_fields = ('author', 'post')
+    search_fields = ('=author__username',)
+    date_hierarchy = 'created'
+    empty_value_display = '-пусто-'
+
+
+class GroupAdmin(ChunkedDeleteAdmin):
+    list_display = ('title', 'slug')
+    search_fields = ('title', 'slug')
+
+
+class DeletionJobAdmin(admin.ModelAdmin):
+    list_display = (
+        'object_repr', 'model', 'status', 'step', 'deleted', 'updated'
+    )
+    list_filter = ('status', 'model')
+    readonly_fields = [field.name for field in DeletionJob._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
 
 admin.site.register(Post, PostAdmin)
-admin.site.register(Group)
+admin.site.register(Comment, CommentAdmin)
+admin.site.register(Group, GroupAdmin)
+admin.site.register(DeletionJob, DeletionJobAdmin)
@@ -0,0 +1,314 @@
+import hashlib
+import logging
+import math
+import itertools
+import random
+import threading
+import time
+from functools import wraps
+from http import HTTPStatus
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import patch_vary_headers
+
+from .fragments import fill_holes
+from .models import Group
+from .tasks import run_in_thread
+
+FEEDS = ('index', 'group', 'profile', 'post', 'follow', 'search')
+OUTCOMES = ('hits', 'misses', 'stale')
+GROUP_CHOICES_KEY = 'group-choices'
+SURROGATE_KEY = 'Surrogate-Key'
+
+logger = logging.getLogger(__name__)
+
+# теги, сброшенные в текущей транзакции этого потока
+_pending_tags = threading.local()
+_purge_ids = itertools.count()
+
+
+def tag_key(tag):
+    return f'cache-tag:{tag}'
+
+
+def _new_version():
+    return int(time.time() * 1000)
+
+
+def tag_versions(tags):
+    """Текущие версии тегов; страница актуальна, пока они не сменились."""
+    keys = {tag_key(tag): tag for tag in tags}
+    found = cache.get_many(list(keys))
+    missing = [key for key in keys if key not in found]
+    if missing:
+        for key in missing:
+            cache.add(key, _new_version(), None)
+        found.update(cache.get_many(missing))
+    return {keys[key]: version for key, version in found.items()}
+
+
+def _bump(tags):
+    for tag in tags:
+        key = tag_key(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # ключ вытеснен: новая версия не должна совпасть со старыми
+            cache.set(key, _new_version(), None)
+
+
+def purge_tags(*tags):
+    """Делает устаревшими все страницы с этими тегами, в том числе в
+    прокси перед сайтом.
+
+    Внутри транзакции версии сдвигаются сразу и ещё раз после коммита:
+    страница, которую другой процесс успел отрисовать по старым строкам
+    уже под новыми версиями, иначе осталась бы в кэше. Теги всей
+    транзакции уходят в прокси одним PURGE из фонового потока.
+    """
+    if not tags:
+        return
+    if transaction.get_connection().in_atomic_block:
+        _bump(tags)
+    if not hasattr(_pending_tags, 'tags'):
+        _pending_tags.tags = set()
+    _pending_tags.tags.update(tags)
+    # первый же колбэк после коммита обработает всё накопленное,
+    # остальные найдут пустой набор; после отката теги уйдут со
+    # следующим коммитом — лишний сброс безвреден
+    transaction.on_commit(_after_commit)
+
+
+def _after_commit():
+    tags = getattr(_pending_tags, 'tags', None)
+    if not tags:
+        return
+    _pending_tags.tags = set()
+    _bump(tags)
+    if settings.CACHE_PURGE_URLS:
+        run_in_thread(
+            f'purge:{next(_purge_ids)}', purge_proxy, (sorted(tags),),
+            _purged
+        )
+
+
+def _purged(tags):
+    logger.debug('Прокси сброшены: %s', ' '.join(tags))
+
+
+def purge_proxy(tags):
+    """PURGE с заголовком Surrogate-Key на каждый адрес прокси."""
+    for url in settings.CACHE_PURGE_URLS:
+        try:
+            requests.request(
+                'PURGE',
+                url,
+                headers={SURROGATE_KEY: ' '.join(sorted(tags))},
+                timeout=settings.CACHE_PURGE_TIMEOUT
+            ).raise_for_status()
+        except requests.RequestException:
+            # прокси сам отпустит страницы по истечении срока
+            logger.warning('Не удалось сбросить %s в %s', tags, url)
+    return tags
+
+
+def post_tags(post):
+    """Теги объектов, которые показывает карточка или страница поста."""
+    tags = {f'post-{post.pk}', f'author-{post.author_id}'}
+    if post.group_id is not None:
+        tags.add(f'group-{post.group_id}')
+    return tags
+
+
+def purge_post(post, old_group_id=None):
+    """Сбрасывает страницы, на которых пост есть или должен появиться."""
+    tags = {'index', 'search', *post_tags(post)}
+    if old_group_id is not None:
+        tags.add(f'group-{old_group_id}')
+    purge_tags(*tags)
+
+
+def add_cache_tags(request, *tags):
+    """Помечает страницу тегами; версии запоминаются сразу, поэтому
+    запись, случившаяся во время рендера, страницу не пропустит."""
+    known = getattr(request, 'cache_tags', None)
+    if known is None:
+        return
+    new = set(tags) - set(known)
+    if new:
+        known.update(tag_versions(new))
+
+
+def add_post_tags(request, posts):
+    """Помечает страницу тегами показанных на ней постов."""
+    tags = set()
+    for post in posts:
+        tags.update(post_tags(post))
+    add_cache_tags(request, *tags)
+
+
+def group_choices():
+    """Пары (pk, название) всех групп для выпадающих списков."""
+    return cache.get_or_set(
+        GROUP_CHOICES_KEY,
+        lambda: [
+            (pk, title) for pk, title in Group.objects.order_by(
+                'title'
+            ).values_list('pk', 'title')
+        ],
+        None
+    )
+
+
+def forget_group_choices():
+    cache.delete(GROUP_CHOICES_KEY)
+
+
+def _record(feed, outcome):
+    key = f'feed-stats:{feed}:{outcome}'
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def feed_stats():
+    """Попадания, промахи и отданные устаревшие страницы по лентам."""
+    keys = [
+        f'feed-stats:{feed}:{outcome}'
+        for feed in FEEDS for outcome in OUTCOMES
+    ]
+    values = cache.get_many(keys)
+    return {
+        feed: {
+            outcome: values.get(f'feed-stats:{feed}:{outcome}', 0)
+            for outcome in OUTCOMES
+        }
+        for feed in FEEDS
+    }
+
+
+def _page_key(feed, audience, request):
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f'feed-page:{feed}:{audience}:{url}'
+
+
+def _lock_key(key):
+    return f'feed-lock:{key}'
+
+
+def _is_current(entry):
+    """Ни один объект на странице не менялся с её рендера."""
+    return tag_versions(entry['tags']) == entry['tags']
+
+
+def _is_fresh(entry, now):
+    """Срок страницы не вышел. Ближе к сроку запрос с вероятностью,
+    растущей со временем пересчёта, решает обновить её заранее
+    (probabilistic early expiration), и пересчитывает обычно один."""
+    early = entry['delta'] * settings.FEED_EARLY_BETA * -math.log(
+        1 - random.random()
+    )
+    return now + early < entry['expires']
+
+
+def _wait_for(key):
+    """Ждёт страницу, которую строит другой запрос."""
+    deadline = time.monotonic() + settings.FEED_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None and _is_current(entry):
+            return entry
+    return None
+
+
+def _is_page(response):
+    return response.status_code == HTTPStatus.OK and not response.streaming
+
+
+def _render_and_store(view, request, args, kwargs, key, timeout):
+    request.cache_tags = {}
+    started = time.monotonic()
+    response = view(request, *args, **kwargs)
+    delta = time.monotonic() - started
+    if not _is_page(response):
+        return response
+    response[SURROGATE_KEY] = ' '.join(sorted(request.cache_tags))
+    timeout = timeout or settings.FEED_CACHE_TIMEOUT
+    cache.set(key, {
+        'response': response,
+        'tags': request.cache_tags,
+        'expires': time.time() + timeout,
+        'delta': delta,
+    }, timeout + settings.FEED_STALE_TIMEOUT)
+    return response
+
+
+def _cached_response(view, request, args, kwargs, feed, key, timeout):
+    entry = cache.get(key)
+    if entry is not None and _is_fresh(entry, time.time()) and _is_current(
+        entry
+    ):
+        _record(feed, 'hits')
+        return entry['response']
+    lock_key = _lock_key(key)
+    locked = cache.add(lock_key, 1, settings.FEED_LOCK_TIMEOUT)
+    if not locked:
+        # страницу уже пересчитывает другой запрос
+        if entry is None:
+            entry = _wait_for(key)
+        else:
+            # по ней клиенту нельзя выдавать валидаторы (conditional)
+            request.stale_page = not _is_current(entry)
+        if entry is not None:
+            _record(feed, 'stale')
+            return entry['response']
+    _record(feed, 'misses')
+    try:
+        return _render_and_store(view, request, args, kwargs, key, timeout)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+
+def cached_feed(feed, per_user=False, timeout=None):
+    """Кэширует страницы ленты до изменения показанных на них объектов.
+
+    Вьюха помечает страницу тегами (add_cache_tags): лента — своим
+    тегом, каждый пост — тегами поста, автора и группы. Сигналы
+    моделей сбрасывают теги (purge_tags), поэтому FEED_CACHE_TIMEOUT
+    может быть долгим; те же теги уходят прокси в Surrogate-Key.
+    Устаревшую страницу пересчитывает один запрос под блокировкой,
+    остальные ещё FEED_STALE_TIMEOUT секунд получают старую версию.
+
+    В кэше лежит оболочка страницы без пользовательских частей, общая
+    для гостей и вошедших; их подставляет posts.fragments.fill_holes.
+    per_user — у каждого пользователя своя лента (подписки).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            audience = f'user-{request.user.pk}' if per_user else 'shell'
+            key = _page_key(feed, audience, request)
+            request.page_shell = True
+            try:
+                response = _cached_response(
+                    view, request, args, kwargs, feed, key, timeout
+                )
+            finally:
+                request.page_shell = False
+            if _is_page(response):
+                response.content = fill_holes(
+                    request, response.content.decode(response.charset)
+                )
+                patch_vary_headers(response, ('Cookie',))
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,268 @@
+"""Двухуровневый кэш: L1 в памяти процесса перед общим L2.
+
+L2 — обычный кэш Django из CACHES (memcached в проде, файловый
+кэш локально и в тестах), общий для всех воркеров. L1 держит
+несколько сотен последних значений не дольше L1_TIMEOUT секунд и
+снимает с L2 чтения горячих ключей: версий тегов, страниц, ключей
+sorl.
+
+Каждая запись в L2 (set, delete, incr) добавляется в журнал
+инвалидаций там же, в L2: счётчик JOURNAL_SEQ и ключи
+JOURNAL_ENTRY с номерами. Воркер не реже раза в SYNC_INTERVAL
+секунд дочитывает журнал и выбрасывает из своего L1 изменённые
+ключи; если журнал потерян или отстал больше чем на JOURNAL_SIZE
+записей, L1 очищается целиком.
+
+Ключи с префиксами из L2_ONLY_PREFIXES (счётчики статистики,
+блокировки) меняются на каждом запросе, а читаются редко: они идут
+прямо в L2, мимо L1 и журнала, иначе журнал переполнялся бы под
+нагрузкой и воркеры очищали бы L1 каждую секунду.
+"""
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+JOURNAL_SEQ = 'two-tier:seq'
+JOURNAL_ENTRY = 'two-tier:inv:{}'
+
+# L1 общий для всех потоков процесса, как у LocMemCache
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class L1Store:
+    def __init__(self):
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.seq = None
+        self.synced = 0
+        self.stats = dict.fromkeys(('hits', 'misses', 'invalidations'), 0)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.data.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry[0]
+            if entry is not None:
+                del self.data[key]
+            self.stats['misses'] += 1
+            return None
+
+    def set(self, key, value, timeout, max_entries):
+        with self.lock:
+            self.data[key] = (value, time.monotonic() + timeout)
+            self.data.move_to_end(key)
+            while len(self.data) > max_entries:
+                self.data.popitem(last=False)
+
+    def discard(self, *keys):
+        with self.lock:
+            for key in keys:
+                if self.data.pop(key, None) is not None:
+                    self.stats['invalidations'] += 1
+
+    def clear(self):
+        with self.lock:
+            self.stats['invalidations'] += len(self.data)
+            self.data.clear()
+
+
+class TwoTierCache(BaseCache):
+    """Кэш-бэкенд: LOCATION — имя кэша L2 в CACHES.
+
+    OPTIONS: L1_TIMEOUT (сек, по умолчанию 5), L1_MAX_ENTRIES (500),
+    SYNC_INTERVAL (сек между чтениями журнала, 1; 0 — при каждом
+    обращении), JOURNAL_SIZE (1000), JOURNAL_TIMEOUT (сек, 300),
+    L2_ONLY_PREFIXES (префиксы ключей мимо L1, ()).
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.l2_alias = location
+        self.l1_timeout = options.get('L1_TIMEOUT', 5)
+        self.l1_max_entries = options.get('L1_MAX_ENTRIES', 500)
+        self.sync_interval = options.get('SYNC_INTERVAL', 1)
+        self.journal_size = options.get('JOURNAL_SIZE', 1000)
+        self.journal_timeout = options.get('JOURNAL_TIMEOUT', 300)
+        self.l2_only_prefixes = tuple(options.get('L2_ONLY_PREFIXES', ()))
+        with _stores_lock:
+            self.l1 = _stores.setdefault(location, L1Store())
+
+    @property
+    def l2(self):
+        return caches[self.l2_alias]
+
+    def _l2_only(self, key):
+        return bool(self.l2_only_prefixes) and key.startswith(
+            self.l2_only_prefixes
+        )
+
+    def _l1_timeout(self, timeout):
+        if timeout == DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self.l1_timeout
+        return min(timeout, self.l1_timeout)
+
+    def _remember(self, key, value, timeout):
+        l1_timeout = self._l1_timeout(timeout)
+        if l1_timeout > 0:
+            self.l1.set(
+                key,
+                pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                l1_timeout,
+                self.l1_max_entries
+            )
+
+    def _publish(self, *keys):
+        """Сообщает остальным воркерам, что ключи изменились."""
+        l2 = self.l2
+        try:
+            seq = l2.incr(JOURNAL_SEQ)
+        except ValueError:
+            l2.add(JOURNAL_SEQ, 0, None)
+            seq = l2.incr(JOURNAL_SEQ)
+        l2.set(JOURNAL_ENTRY.format(seq), keys, self.journal_timeout)
+        # свои изменения уже учтены в L1
+        if self.l1.seq == seq - 1:
+            self.l1.seq = seq
+
+    def sync(self, force=False):
+        """Выбрасывает из L1 ключи, изменённые другими воркерами."""
+        l1 = self.l1
+        now = time.monotonic()
+        if not force and now - l1.synced < self.sync_interval:
+            return
+        l1.synced = now
+        l2 = self.l2
+        seq = l2.get(JOURNAL_SEQ)
+        last = l1.seq
+        l1.seq = seq
+        if seq == last:
+            return
+        if seq is None or last is None or not 0 < seq - last:
+            l1.clear()
+            return
+        if seq - last > self.journal_size:
+            l1.clear()
+            return
+        names = [JOURNAL_ENTRY.format(n) for n in range(last + 1, seq + 1)]
+        entries = l2.get_many(names)
+        if len(entries) < len(names):
+            # запись журнала вытеснена или ещё не дописана
+            l1.clear()
+            return
+        for keys in entries.values():
+            l1.discard(*keys)
+
+    def get(self, key, default=None, version=None):
+        if self._l2_only(key):
+            return self.l2.get(key, default, version=version)
+        l1_key = self.make_key(key, version)
+        self.sync()
+        value = self.l1.get(l1_key)
+        if value is not None:
+            return pickle.loads(value)
+        value = self.l2.get(key, self, version=version)
+        if value is self:
+            return default
+        # срок в L2 неизвестен, поэтому в L1 — не дольше L1_TIMEOUT
+        self._remember(l1_key, value, DEFAULT_TIMEOUT)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout, version=version)
+        if self._l2_only(key):
+            return
+        l1_key = self.make_key(key, version)
+        self._remember(l1_key, value, timeout)
+        self._publish(l1_key)
+
+    def get_many(self, keys, version=None):
+        self.sync()
+        found, missing = {}, []
+        for key in keys:
+            value = None
+            if not self._l2_only(key):
+                value = self.l1.get(self.make_key(key, version))
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = pickle.loads(value)
+        if missing:
+            # недостающие — одним запросом к L2
+            fetched = self.l2.get_many(missing, version=version)
+            for key, value in fetched.items():
+                if not self._l2_only(key):
+                    self._remember(
+                        self.make_key(key, version), value, DEFAULT_TIMEOUT
+                    )
+            found.update(fetched)
+        return found
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, timeout, version=version) or []
+        l1_keys = []
+        for key, value in data.items():
+            if self._l2_only(key) or key in failed:
+                continue
+            l1_key = self.make_key(key, version)
+            self._remember(l1_key, value, timeout)
+            l1_keys.append(l1_key)
+        if l1_keys:
+            self._publish(*l1_keys)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # новый ключ: в чужих L1 его нет, журнал не нужен
+        added = self.l2.add(key, value, timeout, version=version)
+        if added and not self._l2_only(key):
+            self._remember(self.make_key(key, version), value, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.l2.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self.l2.delete(key, version=version)
+        if self._l2_only(key):
+            return
+        l1_key = self.make_key(key, version)
+        self.l1.discard(l1_key)
+        self._publish(l1_key)
+
+    def delete_many(self, keys, version=None):
+        l1_keys = [self.make_key(key, version) for key in keys]
+        self.l2.delete_many(keys, version=version)
+        self.l1.discard(*l1_keys)
+        self._publish(*l1_keys)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.l2.incr(key, delta, version=version)
+        if self._l2_only(key):
+            return value
+        l1_key = self.make_key(key, version)
+        self.l1.discard(l1_key)
+        self._publish(l1_key)
+        return value
+
+    def has_key(self, key, version=None):
+        return self.get(key, self, version=version) is not self
+
+    def clear(self):
+        # журнал в L2 тоже стирается: остальные воркеры очистят L1
+        self.l2.clear()
+        self.l1.clear()
+        self.l1.seq = None
+
+    def stats(self):
+        """Попадания, промахи и инвалидации L1 этого процесса."""
+        with self.l1.lock:
+            return {**self.l1.stats, 'size': len(self.l1.data)}
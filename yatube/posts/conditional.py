@@ -0,0 +1,128 @@
+"""Условные GET для лент и страницы поста: ETag и Last-Modified.
+
+Валидаторы считаются без рендера одним запросом по индексам: дата
+последней публикации (или комментария) и счётчики постов автора,
+которые ведут сигналы. Правки и удаления, не сдвигающие эти даты,
+учитываются версиями тегов страницы из posts.cache. В страницу
+подставлены фрагменты пользователя, поэтому ETag зависит ещё от него
+и адреса.
+
+Last-Modified — время последней публикации: клиент, который шлёт
+только If-Modified-Since, не увидит правок до следующего поста.
+condition() сначала сверяет If-None-Match, поэтому браузеры, которые
+шлют оба заголовка, получают 304 только для неизменённой страницы.
+"""
+import hashlib
+from functools import wraps
+
+from django.db.models import OuterRef, Subquery
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import condition
+
+from .cache import post_tags, tag_versions
+from .models import Comment, Group, Post, User
+
+
+def _latest(queryset, field):
+    """Подзапрос с самой поздней датой выборки — одно чтение индекса."""
+    return Subquery(queryset.order_by(f'-{field}').values(field)[:1])
+
+
+def index_state(request):
+    # удаления и правки отражает тег index: счётчик строк таблицы не
+    # нужен (на PostgreSQL его и нет, см. counters.uses_table_counter)
+    last = Post.objects.order_by('-pub_date').values_list(
+        'pub_date', flat=True
+    ).first()
+    return last, (), ('index',)
+
+
+def group_state(request, slug):
+    row = Group.objects.filter(slug=slug).annotate(
+        last=_latest(Post.objects.filter(group=OuterRef('pk')), 'pub_date')
+    ).values_list('pk', 'last').first()
+    if row is None:
+        return None
+    pk, last = row
+    return last, (), (f'group-{pk}',)
+
+
+def profile_state(request, username):
+    row = User.objects.filter(username=username).annotate(
+        last=_latest(Post.objects.filter(author=OuterRef('pk')), 'pub_date')
+    ).values_list('pk', 'last', 'stats__posts_count').first()
+    if row is None:
+        return None
+    pk, last, posts_count = row
+    tags = [f'author-{pk}']
+    if request.user.is_authenticated:
+        # кнопка подписки
+        tags.append(f'follow-{request.user.pk}')
+    return last, (posts_count,), tags
+
+
+def post_state(request, post_id):
+    row = Post.objects.filter(pk=post_id).annotate(
+        last_comment=_latest(
+            Comment.objects.filter(post=OuterRef('pk')), 'created'
+        )
+    ).values_list(
+        'updated', 'last_comment', 'author_id', 'group_id',
+        'author__stats__posts_count'
+    ).first()
+    if row is None:
+        return None
+    updated, last_comment, author_id, group_id, posts_count = row
+    post = Post(pk=post_id, author_id=author_id, group_id=group_id)
+    return max(filter(None, (updated, last_comment))), (posts_count,), (
+        post_tags(post)
+    )
+
+
+def page_validators(request, state):
+    """(ETag, Last-Modified) по состоянию (дата, счётчики, теги)."""
+    if state is None:
+        return None, None
+    last_modified, counters, tags = state
+    versions = sorted(tag_versions(tags).items())
+    etag = hashlib.md5(repr((
+        request.user.pk, request.get_full_path(), last_modified, counters,
+        versions
+    )).encode()).hexdigest()
+    return etag, last_modified
+
+
+def conditional_page(state):
+    """condition() с валидаторами из state(request, *args, **kwargs).
+
+    Состояние читается один раз на запрос. Если cached_feed отдал
+    устаревшую страницу, валидаторы с ответа снимаются: иначе клиент
+    закрепил бы старое тело под новым ETag.
+    """
+    def validators(request, *args, **kwargs):
+        if not hasattr(request, 'page_validators'):
+            request.page_validators = page_validators(
+                request, state(request, *args, **kwargs)
+            )
+        return request.page_validators
+
+    def decorator(view):
+        conditional = condition(
+            etag_func=lambda *args, **kwargs: validators(
+                *args, **kwargs
+            )[0],
+            last_modified_func=lambda *args, **kwargs: validators(
+                *args, **kwargs
+            )[1],
+        )(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional(request, *args, **kwargs)
+            if getattr(request, 'stale_page', False):
+                del response['ETag']
+                del response['Last-Modified']
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,131 @@
+from django.db import connections, router
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import AuthorStats, Comment, Follow, Post, TableCounter, User
+
+COUNTERS = {
+    'posts_count': (Post, 'author'),
+    'comments_count': (Comment, 'author'),
+    'followers_count': (Follow, 'author'),
+    'following_count': (Follow, 'user'),
+}
+
+
+def bump(user_id, **deltas):
+    """Атомарно сдвигает счётчики пользователя через F-выражения.
+
+    Если строки счётчиков ещё нет, она будет пересчитана при чтении.
+    """
+    AuthorStats.objects.filter(user_id=user_id).update(
+        **{
+            name: Greatest(F(name) + delta, 0)
+            for name, delta in deltas.items()
+        }
+    )
+
+
+def related_count(model, field):
+    """Подзапрос с числом строк model, ссылающихся полем field на
+    внешнюю строку."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+                field
+            ).annotate(total=Count('pk')).values('total')
+        ),
+        0
+    )
+
+
+def actual_counters(user_ids):
+    """Точные значения счётчиков по данным таблиц."""
+    return User.objects.filter(pk__in=user_ids).annotate(
+        **{
+            name: related_count(model, field)
+            for name, (model, field) in COUNTERS.items()
+        }
+    ).values('pk', *COUNTERS)
+
+
+def rebuild(user_ids):
+    """Пересчитывает счётчики пачки пользователей; возвращает число
+    исправленных строк."""
+    stored = AuthorStats.objects.in_bulk(user_ids)
+    missing, drifted = [], []
+    for row in actual_counters(user_ids):
+        user_id = row.pop('pk')
+        stats = stored.get(user_id)
+        if stats is None:
+            missing.append(AuthorStats(user_id=user_id, **row))
+            continue
+        if any(getattr(stats, name) != value for name, value in row.items()):
+            for name, value in row.items():
+                setattr(stats, name, value)
+            drifted.append(stats)
+    AuthorStats.objects.bulk_create(missing, ignore_conflicts=True)
+    AuthorStats.objects.bulk_update(drifted, list(COUNTERS))
+    return len(missing) + len(drifted)
+
+
+def get_stats(user):
+    """Счётчики пользователя; отсутствующая строка создаётся пересчётом."""
+    try:
+        return user.stats
+    except AuthorStats.DoesNotExist:
+        rebuild([user.pk])
+        return AuthorStats.objects.get(user_id=user.pk)
+
+
+def uses_table_counter(model, using=None):
+    """PostgreSQL оценивает число строк сам (pg_class.reltuples); там
+    счётчик не ведётся, чтобы не блокировать одну строку на каждую
+    вставку и удаление."""
+    using = using or router.db_for_write(model)
+    return connections[using].vendor != 'postgresql'
+
+
+def bump_table(model, delta):
+    """Сдвигает поддерживаемое число строк таблицы."""
+    if not uses_table_counter(model):
+        return
+    TableCounter.objects.filter(table=model._meta.db_table).update(
+        rows=Greatest(F('rows') + delta, 0)
+    )
+
+
+def rebuild_table(model):
+    if not uses_table_counter(model):
+        return
+    TableCounter.objects.update_or_create(
+        table=model._meta.db_table,
+        defaults={'rows': model.objects.count()}
+    )
+
+
+def estimated_count(queryset):
+    """Оценка числа строк нефильтрованного queryset без COUNT(*).
+
+    PostgreSQL отдаёт статистику планировщика (pg_class.reltuples),
+    остальные базы — счётчик TableCounter. Для отфильтрованных выборок
+    и таблиц без оценки возвращает None.
+    """
+    query = queryset.query
+    if query.where or query.distinct or not query.can_filter():
+        return None
+    table = queryset.model._meta.db_table
+    connection = connections[queryset.db]
+    if not uses_table_counter(queryset.model, queryset.db):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                [table]
+            )
+            row = cursor.fetchone()
+        # -1: таблицу ещё не анализировали
+        if row is None or row[0] < 0:
+            return None
+        return row[0]
+    return TableCounter.objects.using(queryset.db).filter(
+        table=table
+    ).values_list('rows', flat=True).first()
@@ -0,0 +1,159 @@
+"""Фоновое удаление пользователей, групп и постов пачками.
+
+Обычный delete() собирает в памяти все зависимые объекты и удаляет
+их одной транзакцией: у активного автора это сотни тысяч строк и
+долгие блокировки. Здесь зависимые строки удаляются по
+DELETION_BATCH_SIZE за транзакцию через QuerySet.delete(), поэтому
+сигналы по-прежнему поправляют счётчики, индекс поиска, ленты и
+ссылки на картинки (последняя ссылка удаляет файлы). Прогресс
+пишется в DeletionJob; прерванное задание продолжает команда
+run_deletion_jobs.
+"""
+import logging
+import traceback
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .cache import post_tags, purge_tags
+from .models import (Comment, DeletionJob, Follow, Group, Post,
+                     TimelineEntry, User)
+from .tasks import run_in_pool
+
+logger = logging.getLogger(__name__)
+
+UNFINISHED = (DeletionJob.PENDING, DeletionJob.RUNNING)
+
+
+def delete_rows(queryset):
+    queryset.delete()
+
+
+def unlink_group(queryset):
+    """SET_NULL для постов группы без загрузки их в память."""
+    tags = {'index', 'search'}
+    for post in queryset.only('pk', 'author_id', 'group_id'):
+        tags.update(post_tags(post))
+    queryset.update(group=None)
+    purge_tags(*tags)
+
+
+def user_steps(user):
+    return (
+        ('Комментарии пользователя',
+         Comment.objects.filter(author=user), delete_rows),
+        ('Комментарии к постам пользователя',
+         Comment.objects.filter(post__author=user), delete_rows),
+        ('Подписки',
+         Follow.objects.filter(Q(user=user) | Q(author=user)), delete_rows),
+        ('Лента пользователя',
+         TimelineEntry.objects.filter(user=user), delete_rows),
+        ('Посты', Post.objects.filter(author=user), delete_rows),
+    )
+
+
+def group_steps(group):
+    return (
+        ('Посты группы', Post.objects.filter(group=group), unlink_group),
+    )
+
+
+def post_steps(post):
+    return (
+        ('Комментарии', Comment.objects.filter(post=post), delete_rows),
+    )
+
+
+STEPS = {
+    User._meta.label_lower: user_steps,
+    Group._meta.label_lower: group_steps,
+    Post._meta.label_lower: post_steps,
+}
+
+
+def dependent_models(obj):
+    """Модели, строки которых удалит или изменит задание. Лента
+    подписок — производные данные, её в списке нет."""
+    models = {
+        queryset.model for _, queryset, _ in STEPS[obj._meta.label_lower](obj)
+    }
+    models.discard(TimelineEntry)
+    return models
+
+
+def schedule_deletion(obj):
+    """Ставит объект в очередь на удаление; повторный вызов для того же
+    объекта возвращает незавершённое задание."""
+    label = obj._meta.label_lower
+    if label not in STEPS:
+        raise ValueError(f'Пачками не удаляются объекты {label}')
+    job = DeletionJob.objects.filter(
+        model=label, object_id=obj.pk, status__in=UNFINISHED
+    ).first()
+    if job is not None:
+        return job
+    job = DeletionJob.objects.create(
+        model=label, object_id=obj.pk, object_repr=str(obj)[:200]
+    )
+    if isinstance(obj, User) and obj.is_active:
+        # пока удаляются его данные, пользователь не должен писать новые
+        obj.is_active = False
+        obj.save(update_fields=['is_active'])
+    transaction.on_commit(lambda: run_in_pool(
+        f'deletion:{job.pk}', run_deletion_job, (job.pk,), _log_result,
+        pool='jobs'
+    ))
+    return job
+
+
+def _log_result(job):
+    logger.info('Удаление %s: %s', job, job.deleted)
+
+
+def _save_progress(job, **fields):
+    for name, value in fields.items():
+        setattr(job, name, value)
+    job.save(update_fields=[*fields, 'updated'])
+
+
+def run_deletion_job(job_id, batch_size=None):
+    """Выполняет задание с того места, где оно остановилось."""
+    batch_size = batch_size or settings.DELETION_BATCH_SIZE
+    job = DeletionJob.objects.get(pk=job_id)
+    if job.status == DeletionJob.DONE:
+        return job
+    model = apps.get_model(job.model)
+    obj = model._default_manager.filter(pk=job.object_id).first()
+    if obj is None:
+        _save_progress(job, status=DeletionJob.DONE, step='')
+        return job
+    _save_progress(job, status=DeletionJob.RUNNING, error='')
+    try:
+        for step, queryset, action in STEPS[job.model](obj):
+            _save_progress(job, step=step)
+            while True:
+                # без сортировки: LIMIT останавливает чтение индекса
+                pks = list(
+                    queryset.order_by().values_list('pk', flat=True)[
+                        :batch_size
+                    ]
+                )
+                if not pks:
+                    break
+                with transaction.atomic():
+                    action(queryset.model.objects.filter(pk__in=pks))
+                _save_progress(job, deleted=job.deleted + len(pks))
+        _save_progress(job, step='Объект')
+        with transaction.atomic():
+            obj.delete()
+        _save_progress(
+            job, status=DeletionJob.DONE, step='', deleted=job.deleted + 1
+        )
+    except Exception:
+        logger.exception('Удаление %s прервано', job)
+        _save_progress(
+            job, status=DeletionJob.FAILED, error=traceback.format_exc()
+        )
+    return job
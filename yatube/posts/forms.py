@@ -1,6 +1,7 @@
 from django import forms
 
 from .models import Comment, Post
+from .uploads import ingest_image
 
 
 class PostForm(forms.ModelForm):
@@ -12,6 +13,12 @@ class PostForm(forms.ModelForm):
             'image'
         )
 
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        if 'image' not in self.files or not image:
+            return image
+        return ingest_image(image)
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,84 @@
+"""Пользовательские части страниц, вырезанные из закэшированной оболочки.
+
+Ленты и страница поста кэшируются одной оболочкой для всех
+посетителей: на месте шапки, вкладок лент, кнопок подписки и
+редактирования и формы комментария тег {% hole %} оставляет подписанную метку.
+fill_holes рендерит эти фрагменты для текущего запроса — это
+несколько маленьких шаблонов и не больше одного запроса к базе.
+"""
+import re
+
+from django.core import signing
+from django.template.loader import render_to_string
+
+from .forms import CommentForm
+from .models import Follow
+
+SALT = 'posts.fragments'
+HOLE = re.compile(r'<!--hole:([\w.:-]+)-->')
+
+FRAGMENTS = {}
+
+
+def fragment(template):
+    """Регистрирует фрагмент: функция по запросу и аргументам метки
+    возвращает контекст шаблона."""
+    def decorator(func):
+        FRAGMENTS[func.__name__] = (func, template)
+        return func
+    return decorator
+
+
+@fragment('includes/header_user.html')
+def header_user(request, view_name=None):
+    return {'view_name': view_name}
+
+
+@fragment('posts/includes/switcher.html')
+def switcher(request, active):
+    # вкладки лент видны только вошедшим
+    return {active: True}
+
+
+@fragment('posts/includes/follow_button.html')
+def follow_button(request, author):
+    user = request.user
+    return {
+        'author': author,
+        'is_author': user.is_authenticated and user.username == author,
+        'following': user.is_authenticated and Follow.objects.filter(
+            user=user, author__username=author
+        ).exists(),
+    }
+
+
+@fragment('posts/includes/edit_button.html')
+def edit_button(request, post_id, author_id):
+    return {'post_id': post_id, 'is_author': request.user.pk == author_id}
+
+
+@fragment('posts/includes/comment_form.html')
+def comment_form(request, post_id):
+    return {'post_id': post_id, 'form': CommentForm()}
+
+
+def render_fragment(request, name, kwargs):
+    func, template = FRAGMENTS[name]
+    return render_to_string(
+        template, func(request, **kwargs), request=request
+    )
+
+
+def hole_marker(name, kwargs):
+    return f'<!--hole:{signing.dumps([name, kwargs], salt=SALT)}-->'
+
+
+def fill_holes(request, content):
+    """Подставляет в оболочку фрагменты текущего пользователя."""
+    def fill(match):
+        try:
+            name, kwargs = signing.loads(match.group(1), salt=SALT)
+        except signing.BadSignature:
+            return ''
+        return render_fragment(request, name, kwargs)
+    return HOLE.sub(fill, content)
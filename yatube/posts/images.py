@@ -0,0 +1,140 @@
+"""Картинки постов: адаптивные варианты (AVIF/WebP разной ширины)
+и учёт ссылок на общие файлы."""
+import json
+import logging
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+from sorl.thumbnail import delete as delete_thumbnails
+from sorl.thumbnail.images import ImageFile
+
+from .cache import purge_post
+from .models import Post, StoredImage
+from .storage import image_storage
+from .tasks import run_in_pool
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'posts/variants'
+
+
+def refresh_posts(image_name, **fields):
+    """Обновляет посты с этой картинкой и сбрасывает их карточки и ленты."""
+    posts = Post.objects.select_related('author', 'group').filter(
+        image=image_name
+    )
+    for post in posts:
+        Post.objects.filter(pk=post.pk).update(
+            updated=timezone.now(), **fields
+        )
+        purge_post(post)
+
+
+def variant_name(name, width, image_format):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return f'{VARIANTS_DIR}/{stem}_{width}.{image_format}'
+
+
+def render_variants(name):
+    """Режет картинку под ширины POST_IMAGE_WIDTHS в форматы
+    POST_IMAGE_FORMATS; выполняется в рабочем процессе.
+
+    Возвращает {формат: [[ширина, имя файла], ...]}.
+    """
+    formats = [
+        image_format for image_format in settings.POST_IMAGE_FORMATS
+        if features.check(image_format)
+    ]
+    aspect_width, aspect_height = settings.POST_IMAGE_ASPECT
+    with default_storage.open(name) as file, Image.open(file) as image:
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    widths = [
+        width for width in settings.POST_IMAGE_WIDTHS if width <= image.width
+    ] or [min(settings.POST_IMAGE_WIDTHS)]
+    variants = {image_format: [] for image_format in formats}
+    for width in sorted(widths):
+        size = (width, round(width * aspect_height / aspect_width))
+        resized = ImageOps.fit(image, size, Image.LANCZOS)
+        for image_format in formats:
+            buffer = BytesIO()
+            resized.save(
+                buffer,
+                image_format,
+                quality=settings.POST_IMAGE_QUALITY
+            )
+            target = variant_name(name, width, image_format)
+            if default_storage.exists(target):
+                default_storage.delete(target)
+            target = default_storage.save(
+                target, ContentFile(buffer.getvalue())
+            )
+            variants[image_format].append([width, target])
+    return variants
+
+
+def queue_post_variants(post):
+    """Ставит нарезку адаптивных вариантов картинки поста в фоновый пул."""
+    if not post.image:
+        return
+    name = post.image.name
+    ready = Post.objects.filter(image=name).exclude(
+        image_variants=''
+    ).values_list('image_variants', flat=True).first()
+    if ready:
+        # тот же файл уже загружали: варианты общие
+        refresh_posts(name, image_variants=ready)
+        return
+    run_in_pool(
+        ('variants', name),
+        render_variants,
+        (name,),
+        lambda variants: refresh_posts(
+            name, image_variants=json.dumps(variants)
+        )
+    )
+
+
+def acquire_image(name):
+    """Учитывает ещё один пост, ссылающийся на файл name."""
+    StoredImage.objects.get_or_create(name=name)
+    StoredImage.objects.filter(name=name).update(refs=F('refs') + 1)
+
+
+def release_image(name):
+    """Снимает ссылку на файл; последняя ссылка удаляет файл, его
+    миниатюры и варианты после коммита транзакции."""
+    StoredImage.objects.filter(name=name).update(
+        refs=Greatest(F('refs') - 1, 0)
+    )
+    deleted, _ = StoredImage.objects.filter(name=name, refs=0).delete()
+    if deleted:
+        transaction.on_commit(lambda: delete_image_files(name))
+
+
+def delete_image_files(name):
+    # файл могли загрузить снова, пока транзакция шла; посты, созданные
+    # в обход сигналов, тоже не даём в обиду
+    if (
+        StoredImage.objects.filter(name=name).exists()
+        or Post.objects.filter(image=name).exists()
+    ):
+        return
+    try:
+        delete_thumbnails(ImageFile(name, image_storage))
+        for width in settings.POST_IMAGE_WIDTHS:
+            for image_format in settings.POST_IMAGE_FORMATS:
+                default_storage.delete(
+                    variant_name(name, width, image_format)
+                )
+    except (OSError, SuspiciousFileOperation):
+        # файл останется на диске, но удаление поста не должно падать
+        logger.exception('Не удалось удалить картинку %s', name)
@@ -0,0 +1,91 @@
+"""KV-хранилище sorl-thumbnail с LRU в памяти процесса."""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from sorl.thumbnail.helpers import deserialize
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore
+
+
+class LRUKVStore(KVStore):
+    """cached_db KVStore, перед которым стоит ограниченный LRU.
+
+    Каждый {% thumbnail %} читает ключ миниатюры; найденные значения
+    живут в процессе THUMBNAIL_LRU_TIMEOUT секунд, так что лента
+    рендерится без обращений к кэшу и базе. Промахи не запоминаются:
+    по ним миниатюра ставится в очередь и скоро появится.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(
+            ('hits', 'misses', 'evictions', 'expired'), 0
+        )
+
+    def _remember(self, key, value):
+        expires = time.monotonic() + settings.THUMBNAIL_LRU_TIMEOUT
+        with self._lock:
+            self._lru[key] = (value, expires)
+            self._lru.move_to_end(key)
+            while len(self._lru) > settings.THUMBNAIL_LRU_SIZE:
+                self._lru.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def _forget(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._lru.pop(key, None)
+
+    def _get_raw(self, key):
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                if entry[1] > time.monotonic():
+                    self._lru.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return entry[0]
+                del self._lru[key]
+                self._stats['expired'] += 1
+            self._stats['misses'] += 1
+        value = super()._get_raw(key)
+        if value is not None:
+            self._remember(key, value)
+        return value
+
+    def _set_raw(self, key, value):
+        super()._set_raw(key, value)
+        self._remember(key, value)
+
+    def _delete_raw(self, *keys):
+        super()._delete_raw(*keys)
+        self._forget(*keys)
+
+    def clear(self, delete_thumbnails=False):
+        super().clear(delete_thumbnails)
+        with self._lock:
+            self._lru.clear()
+
+    def forget(self, image_file):
+        """Убирает из LRU исходник и все его миниатюры; общее хранилище
+        не трогает."""
+        image_key = add_prefix(image_file.key)
+        thumbnails_key = add_prefix(image_file.key, identity='thumbnails')
+        keys = [image_key, thumbnails_key]
+        thumbnails = super()._get_raw(thumbnails_key)
+        if thumbnails:
+            keys.extend(add_prefix(key) for key in deserialize(thumbnails))
+        self._forget(*keys)
+
+    def stats(self):
+        """Попадания, промахи, вытеснения и размер LRU этого процесса."""
+        with self._lock:
+            return {
+                **self._stats,
+                'size': len(self._lru),
+                'bytes': sum(len(value) for value, _ in self._lru.values()),
+                'max_size': settings.THUMBNAIL_LRU_SIZE,
+            }
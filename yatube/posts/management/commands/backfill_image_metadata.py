@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.uploads import EMPTY_IMAGE_METADATA, image_metadata
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет размеры, вес, формат и хэш картинок у постов, '
+        'загруженных до появления этих полей.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько постов обновлять одним запросом.'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересчитать и уже заполненные посты.'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        posts = Post.objects.exclude(image='').exclude(image=None)
+        if not options['all']:
+            posts = posts.filter(image_hash='')
+        posts = posts.order_by('pk').only('pk', 'image')
+        last_pk, updated, missing = 0, 0, 0
+        while True:
+            batch = list(posts.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            changed = []
+            for post in batch:
+                try:
+                    with post.image.open('rb') as file:
+                        metadata = image_metadata(file)
+                except (OSError, SyntaxError, ValueError) as error:
+                    # файла нет или это не картинка: строку не трогаем
+                    missing += 1
+                    self.stderr.write(f'Пост {post.pk}: {error}')
+                    continue
+                for field, value in metadata.items():
+                    setattr(post, field, value)
+                changed.append(post)
+            Post.objects.bulk_update(changed, list(EMPTY_IMAGE_METADATA))
+            updated += len(changed)
+            last_pk = batch[-1].pk
+            self.stdout.write(f'Обновлено: {updated}, пропущено: {missing}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово. Обновлено: {updated}, пропущено: {missing}'
+        ))
@@ -0,0 +1,95 @@
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from posts.tasks import _init_worker
+from posts.uploads import ingest_image
+
+MODES = ('naive', 'ingest')
+
+
+def _measure(path, mode):
+    """Обрабатывает файл в свежем процессе и возвращает прирост пиковой
+    памяти процесса, пик tracemalloc и время."""
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    started = time.perf_counter()
+    with open(path, 'rb') as file:
+        if mode == 'naive':
+            # то, что делал бы обработчик без ingest_image
+            with Image.open(file) as image:
+                image.load()
+                image.thumbnail(
+                    (settings.POST_IMAGE_MAX_SIDE,) * 2, Image.LANCZOS
+                )
+        else:
+            ingest_image(UploadedFile(
+                file,
+                os.path.basename(path),
+                'image/jpeg',
+                os.path.getsize(path)
+            ))
+    elapsed = time.perf_counter() - started
+    traced = tracemalloc.get_traced_memory()[1]
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss в Linux — в килобайтах
+    return (peak - baseline) * 1024, traced, elapsed
+
+
+def _make_photo(megapixels, directory):
+    width = int((megapixels * 10 ** 6 * 4 / 3) ** 0.5)
+    height = width * 3 // 4
+    path = os.path.join(directory, f'{megapixels}mp.jpg')
+    Image.linear_gradient('L').resize((width, height)).convert(
+        'RGB'
+    ).save(path, quality=90)
+    return path
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет пиковую память при приёме большого JPEG: полное '
+        'декодирование против ingest_image (draft, уменьшение, без EXIF).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--megapixels',
+            type=int,
+            nargs='+',
+            default=[12, 50],
+            help='Размеры тестовых фото.'
+        )
+
+    def run(self, func, *args):
+        # новый процесс на каждый вызов: ru_maxrss не сбрасывается и
+        # наследуется порождённым процессом, поэтому и фото создаются
+        # не в этом процессе
+        with ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker
+        ) as executor:
+            return executor.submit(func, *args).result()
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            for megapixels in options['megapixels']:
+                path = self.run(_make_photo, megapixels, directory)
+                for mode in MODES:
+                    rss, traced, elapsed = self.run(_measure, path, mode)
+                    self.stdout.write(
+                        f'{megapixels:>4} Мп {mode:>6}: '
+                        f'пик RSS +{rss / 2 ** 20:.1f} МБ, '
+                        f'tracemalloc {traced / 2 ** 20:.1f} МБ, '
+                        f'{elapsed * 1000:.0f} мс'
+                    )
@@ -0,0 +1,44 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.template.loader import get_template
+
+from posts.paginators import PostPaginator
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет рендер posts/includes/paginator.html при росте числа '
+        'страниц: время не должно зависеть от размера ленты.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[10, 1000, 100000, 1000000],
+            help='Число страниц в ленте.'
+        )
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        template = get_template('posts/includes/paginator.html')
+        for num_pages in options['sizes']:
+            # range не материализует записи — считаем только паджинатор
+            paginator = PostPaginator(
+                range(num_pages * settings.POST_LIMIT), settings.POST_LIMIT
+            )
+            page_obj = paginator.get_page(num_pages // 2)
+            page_obj.page_window = list(paginator.get_elided_page_range(
+                page_obj.number, on_each_side=settings.PAGE_WINDOW
+            ))
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                html = template.render({'page_obj': page_obj})
+            elapsed = (time.perf_counter() - started) / options['repeat']
+            self.stdout.write(
+                f'{num_pages:>9} страниц: {elapsed * 1000:.3f} мс, '
+                f'{len(html)} байт'
+            )
@@ -0,0 +1,71 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from faker import Faker
+
+from posts.models import Post, User
+from posts.search import rebuild_index, search_posts
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает поиск по индексу с LIKE-поиском админки: число '
+        'найденного и первая страница выдачи.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--posts',
+            type=int,
+            default=0,
+            help=(
+                'Сгенерировать столько постов на время замера '
+                '(транзакция откатывается).'
+            )
+        )
+        parser.add_argument(
+            '--queries',
+            nargs='+',
+            default=['котики', 'программирование', 'летом на море'],
+        )
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def generate(self, count):
+        fake = Faker('ru_RU')
+        words = fake.words(2000) + ['котики', 'программирование', 'море']
+        author = User.objects.create(username='bench-search')
+        Post.objects.bulk_create(
+            Post(author=author, text=' '.join(random.choices(words, k=40)))
+            for _ in range(count)
+        )
+        rebuild_index()
+
+    def measure(self, queryset):
+        started = time.perf_counter()
+        for _ in range(self.repeat):
+            count = queryset.count()
+            list(queryset[:settings.POST_LIMIT])
+        return count, (time.perf_counter() - started) / self.repeat
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        self.stdout.write(f'База данных: {connection.vendor}')
+        with transaction.atomic():
+            if options['posts']:
+                self.generate(options['posts'])
+            self.stdout.write(f'Постов: {Post.objects.count()}')
+            for query in options['queries']:
+                like = Post.objects.filter(text__icontains=query)
+                for name, queryset in (
+                    ('LIKE', like),
+                    ('индекс', search_posts(query)),
+                ):
+                    count, elapsed = self.measure(queryset)
+                    self.stdout.write(
+                        f'{query!r:>20} {name:>6}: найдено {count}, '
+                        f'{elapsed * 1000:.1f} мс'
+                    )
+            transaction.set_rollback(True)
@@ -0,0 +1,239 @@
+import os
+import time
+from itertools import islice
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from sorl.thumbnail import default
+from sorl.thumbnail.kvstores.base import add_prefix, del_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from posts.images import VARIANTS_DIR as VARIANTS
+from posts.models import Post, StoredImage
+from posts.storage import image_storage
+
+ORIGINALS = 'posts'
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def walk(storage, directory, skip=()):
+    """Имена файлов каталога хранилища; os.scandir не собирает
+    каталог целиком в список, в отличие от storage.listdir."""
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = os.scandir(storage.path(current))
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                name = f'{current}/{entry.name}'
+                if entry.is_dir(follow_symlinks=False):
+                    if name not in skip:
+                        stack.append(name)
+                else:
+                    yield name, entry.stat()
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет картинки, варианты и миниатюры, на которые не ссылается '
+        'ни один пост.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, что будет удалено.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько файлов проверять одним запросом.'
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=50,
+            help='Не больше стольких удалений в секунду (0 — без ограничения).'
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=60 * 60,
+            help=(
+                'Не трогать файлы моложе стольких секунд: пост с только что '
+                'загруженной картинкой может быть ещё не сохранён.'
+            )
+        )
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.rate = options['rate']
+        self.next_delete = time.monotonic()
+        self.checked = self.orphans = self.freed = 0
+        self.cutoff = cutoff = time.time() - options['min_age']
+        batch_size = options['batch_size']
+        for batch in batched(self.old_files(ORIGINALS, cutoff), batch_size):
+            self.collect_originals(batch)
+        for batch in batched(self.old_files(VARIANTS, cutoff), batch_size):
+            self.collect_variants(batch)
+        self.collect_thumbnails(batch_size)
+        verb = 'Можно удалить' if self.dry_run else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово. Проверено: {self.checked}. {verb}: {self.orphans} '
+            f'файлов, {self.freed / 2 ** 20:.1f} МБ'
+        ))
+
+    def old_files(self, directory, cutoff):
+        skip = {VARIANTS} if directory == ORIGINALS else ()
+        for name, stat in walk(image_storage, directory, skip):
+            if stat.st_mtime < cutoff:
+                yield name, stat.st_size
+
+    def report(self, section):
+        self.stdout.write(
+            f'{section}: проверено {self.checked}, сирот {self.orphans}, '
+            f'{self.freed / 2 ** 20:.1f} МБ'
+        )
+
+    def throttle(self):
+        if not self.rate:
+            return
+        delay = self.next_delete - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.next_delete = max(self.next_delete, time.monotonic()) + (
+            1 / self.rate
+        )
+
+    def delete(self, storage, name, size, still_orphan=None):
+        """Удаляет файл; still_orphan(name) повторяет проверку ссылок
+        после паузы --rate, прямо перед удалением."""
+        if self.dry_run:
+            self.orphans += 1
+            self.freed += size
+            self.stdout.write(f'  {name}')
+            return False
+        self.throttle()
+        if still_orphan is not None and not still_orphan(name):
+            return False
+        self.orphans += 1
+        self.freed += size
+        storage.delete(name)
+        return True
+
+    def original_is_orphan(self, name):
+        # за время паузы файл могли загрузить снова: storage.save
+        # обновляет mtime, а пост или счётчик ссылок могли появиться
+        try:
+            if image_storage.get_modified_time(name).timestamp() >= (
+                self.cutoff
+            ):
+                return False
+        except FileNotFoundError:
+            return False
+        return not (
+            Post.objects.filter(image=name).exists()
+            or StoredImage.objects.filter(name=name, refs__gt=0).exists()
+        )
+
+    def collect_originals(self, batch):
+        names = [name for name, _ in batch]
+        referenced = set(
+            Post.objects.filter(image__in=names).values_list(
+                'image', flat=True
+            )
+        )
+        for name, size in batch:
+            if name in referenced:
+                continue
+            if self.delete(
+                image_storage, name, size, self.original_is_orphan
+            ):
+                StoredImage.objects.filter(name=name, refs=0).delete()
+        self.checked += len(batch)
+        self.report('Оригиналы')
+
+    def collect_variants(self, batch):
+        # posts/variants/<хэш>_<ширина>.<формат> → posts/<хэш>.*
+        sources = {
+            name: os.path.basename(name).rsplit('_', 1)[0]
+            for name, _ in batch
+        }
+        query = Q()
+        for stem in set(sources.values()):
+            query |= Q(image__startswith=f'{ORIGINALS}/{stem}.')
+        referenced = {
+            os.path.splitext(os.path.basename(image))[0]
+            for image in Post.objects.filter(query).values_list(
+                'image', flat=True
+            )
+        }
+        for name, size in batch:
+            if sources[name] not in referenced:
+                self.delete(default_storage, name, size)
+        self.checked += len(batch)
+        self.report('Варианты')
+
+    def source_keys(self, batch_size):
+        """Ключи источников, у которых есть миниатюры, пачками по
+        первичному ключу таблицы KV-хранилища sorl."""
+        prefix = add_prefix('', identity='thumbnails')
+        last = prefix
+        while True:
+            batch = list(
+                KVStoreModel.objects.filter(
+                    key__startswith=prefix, key__gt=last
+                ).order_by('key').values_list('key', flat=True)[:batch_size]
+            )
+            if not batch:
+                return
+            last = batch[-1]
+            yield [del_prefix(key) for key in batch]
+
+    def collect_thumbnails(self, batch_size):
+        kvstore = default.kvstore
+        for batch in self.source_keys(batch_size):
+            sources = [kvstore._get(key) for key in batch]
+            sources = [source for source in sources if source is not None]
+            referenced = set(
+                Post.objects.filter(
+                    image__in=[source.name for source in sources]
+                ).values_list('image', flat=True)
+            )
+            for source in sources:
+                if source.name not in referenced:
+                    self.collect_source_thumbnails(kvstore, source)
+            self.checked += len(batch)
+            self.report('Миниатюры')
+
+    def collect_source_thumbnails(self, kvstore, source):
+        thumbnails = kvstore._get(source.key, identity='thumbnails') or []
+        for key in thumbnails:
+            thumbnail = kvstore._get(key)
+            if thumbnail is not None and thumbnail.exists():
+                self.delete(
+                    thumbnail.storage,
+                    thumbnail.name,
+                    thumbnail.storage.size(thumbnail.name)
+                )
+        if self.dry_run:
+            return
+        # файлы удалены выше с учётом --rate, здесь — только ссылки
+        for key in thumbnails:
+            kvstore._delete(key)
+        kvstore._delete(source.key, identity='thumbnails')
+        kvstore._delete(source.key)
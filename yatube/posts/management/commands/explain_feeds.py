@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from posts.models import Follow, Group, Post, User
+from posts.paginators import CursorPaginator
+from posts.queries import (follow_posts, group_posts, index_posts,
+                           post_comments, post_with_counts, profile_posts)
+
+
+class Command(BaseCommand):
+    help = (
+        'Печатает планы запросов (EXPLAIN) для лент и страницы поста, '
+        'чтобы видеть, какие индексы используются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='Автор для profile/follow.')
+        parser.add_argument('--group', help='Slug группы для group_posts.')
+        parser.add_argument('--post', type=int, help='id поста.')
+        parser.add_argument(
+            '--analyze',
+            action='store_true',
+            help='EXPLAIN ANALYZE (только PostgreSQL).'
+        )
+
+    def get_objects(self, options):
+        user = User.objects.filter(
+            username=options['username']
+        ).first() if options['username'] else User.objects.first()
+        group = Group.objects.filter(
+            slug=options['group']
+        ).first() if options['group'] else Group.objects.first()
+        post = Post.objects.filter(
+            pk=options['post']
+        ).first() if options['post'] else Post.objects.first()
+        if user is None or post is None:
+            raise CommandError('Нужны хотя бы один пользователь и один пост.')
+        return user, group, post
+
+    def get_queries(self, user, group, post):
+        # те же выборки, что и во вьюхах, см. posts.queries
+        limit = settings.POST_LIMIT
+        comments = CursorPaginator(
+            post_comments(post.pk),
+            settings.COMMENT_LIMIT,
+            field='created'
+        )
+        queries = {
+            'index': index_posts()[:limit],
+            'profile': profile_posts(user)[:limit],
+            'follow_index': follow_posts(user)[:limit],
+            'post_detail': post_with_counts().filter(pk=post.pk),
+            'post_detail comments': comments.first_page_query(),
+            'profile following': Follow.objects.filter(
+                user=user, author=post.author
+            ),
+            'author followers': Follow.objects.filter(author=user),
+        }
+        if group is not None:
+            queries['group_posts'] = group_posts(group)[:limit]
+        return queries
+
+    def handle(self, *args, **options):
+        explain_options = {}
+        if options['analyze']:
+            if connection.vendor != 'postgresql':
+                raise CommandError('--analyze доступен только в PostgreSQL.')
+            explain_options['analyze'] = True
+        queries = self.get_queries(*self.get_objects(options))
+        self.stdout.write(f'База данных: {connection.vendor}')
+        for name, queryset in queries.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n== {name}'))
+            self.stdout.write(str(queryset.query))
+            self.stdout.write(queryset.explain(**explain_options))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from posts.cache import feed_stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает попадания, промахи и устаревшие ответы кэша лент.'
+    )
+
+    def handle(self, *args, **options):
+        for feed, stats in feed_stats().items():
+            total = sum(stats.values())
+            # устаревшая страница — тоже ответ из кэша
+            ratio = (stats['hits'] + stats['stale']) / total if total else 0
+            self.stdout.write(
+                f'{feed}: попаданий {stats["hits"]}, '
+                f'промахов {stats["misses"]}, '
+                f'устаревших {stats["stale"]}, hit ratio {ratio:.1%}'
+            )
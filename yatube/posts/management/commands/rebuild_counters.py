@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import rebuild, rebuild_table
+from posts.models import Comment, Post, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счётчики постов, комментариев и подписок '
+        'и число строк таблиц постов и комментариев.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько пользователей пересчитывать за один проход.'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_pk, checked, fixed = 0, 0, 0
+        while True:
+            batch = list(
+                User.objects.filter(pk__gt=last_pk).order_by(
+                    'pk'
+                ).values_list('pk', flat=True)[:batch_size]
+            )
+            if not batch:
+                break
+            fixed += rebuild(batch)
+            checked += len(batch)
+            last_pk = batch[-1]
+            self.stdout.write(f'Проверено: {checked}, исправлено: {fixed}')
+        rebuild_table(Post)
+        rebuild_table(Comment)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово. Проверено: {checked}, исправлено: {fixed}'
+        ))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from posts.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Заново строит поисковый индекс постов (нужно после загрузки '
+        'постов в обход сигналов, например bulk_create или loaddata).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько постов индексировать за один проход.'
+        )
+
+    def handle(self, *args, **options):
+        total = rebuild_index(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово. Проиндексировано постов: {total}'
+        ))
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.deletion import UNFINISHED, run_deletion_job
+from posts.models import DeletionJob
+
+
+class Command(BaseCommand):
+    help = (
+        'Продолжает фоновые удаления, прерванные перезапуском или ошибкой.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.DELETION_BATCH_SIZE,
+            help='Сколько зависимых строк удалять за одну транзакцию.'
+        )
+        parser.add_argument(
+            '--retry-failed',
+            action='store_true',
+            help='Повторить и задания, завершившиеся ошибкой.'
+        )
+
+    def handle(self, *args, **options):
+        statuses = list(UNFINISHED)
+        if options['retry_failed']:
+            statuses.append(DeletionJob.FAILED)
+        jobs = DeletionJob.objects.filter(status__in=statuses).order_by(
+            'created'
+        ).values_list('pk', flat=True)
+        done = failed = 0
+        for job_id in jobs:
+            job = run_deletion_job(job_id, options['batch_size'])
+            self.stdout.write(
+                f'{job}: обработано строк {job.deleted}'
+            )
+            if job.status == DeletionJob.DONE:
+                done += 1
+            else:
+                failed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово. Выполнено: {done}, с ошибкой: {failed}'
+        ))
@@ -0,0 +1,77 @@
+# Generated by Django 2.2.16 on 2026-10-17 04:30
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+BATCH_SIZE = 1000
+
+
+def _count(model, field):
+    # подзапрос с числом строк model, ссылающихся на пользователя
+    return Coalesce(
+        models.Subquery(
+            model.objects.filter(
+                **{field: models.OuterRef('pk')}
+            ).order_by().values(field).annotate(
+                total=models.Count('pk')
+            ).values('total')
+        ),
+        0
+    )
+
+
+def fill_stats(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    # одно чтение на пачку пользователей, а не четыре COUNT на каждого
+    users = User.objects.order_by('pk').annotate(
+        posts_count=_count(Post, 'author'),
+        comments_count=_count(Comment, 'author'),
+        followers_count=_count(Follow, 'author'),
+        following_count=_count(Follow, 'user'),
+    ).values(
+        'pk', 'posts_count', 'comments_count', 'followers_count',
+        'following_count'
+    )
+    last_pk = None
+    while True:
+        batch = users if last_pk is None else users.filter(pk__gt=last_pk)
+        rows = list(batch[:BATCH_SIZE])
+        if not rows:
+            return
+        last_pk = rows[-1]['pk']
+        AuthorStats.objects.bulk_create(
+            AuthorStats(user_id=row.pop('pk'), **row) for row in rows
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0002_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Постов')),
+                ('comments_count', models.PositiveIntegerField(default=0, verbose_name='Комментариев')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Подписок')),
+            ],
+            options={
+                'verbose_name': 'Счётчики автора',
+                'verbose_name_plural': 'Счётчики авторов',
+            },
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
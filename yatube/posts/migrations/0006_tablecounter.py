@@ -0,0 +1,33 @@
+# Generated by Django 2.2.16 on 2026-10-17 04:36
+
+from django.db import migrations, models
+
+
+def fill_post_counter(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    TableCounter = apps.get_model('posts', 'TableCounter')
+    TableCounter.objects.create(
+        table=Post._meta.db_table, rows=Post.objects.count()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_post_updated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableCounter',
+            fields=[
+                ('table', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Таблица')),
+                ('rows', models.BigIntegerField(default=0, verbose_name='Строк')),
+            ],
+            options={
+                'verbose_name': 'Счётчик таблицы',
+                'verbose_name_plural': 'Счётчики таблиц',
+            },
+        ),
+        migrations.RunPython(fill_post_counter, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-17 04:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0006_tablecounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_variants',
+            field=models.TextField(blank=True, default='', help_text='JSON {формат: [[ширина, файл], ...]}, пишется фоном', verbose_name='Адаптивные варианты картинки'),
+        ),
+    ]
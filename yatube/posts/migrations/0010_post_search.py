@@ -0,0 +1,54 @@
+# Generated by Django 2.2.16 on 2026-10-17 04:56
+
+from django.db import migrations
+
+from posts.stemmer import stem_words
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        Post = apps.get_model('posts', 'Post')
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE posts_post_fts USING fts5(body)'
+        )
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO posts_post_fts (rowid, body) VALUES (%s, %s)',
+                [
+                    (pk, ' '.join(stem_words(text)))
+                    for pk, text in Post.objects.values_list('pk', 'text')
+                ]
+            )
+    elif vendor == 'postgresql':
+        # вычисляемая колонка (PostgreSQL 12+) не отстаёт от text
+        schema_editor.execute(
+            'ALTER TABLE posts_post ADD COLUMN search_vector tsvector '
+            "GENERATED ALWAYS AS (to_tsvector('russian', text)) STORED"
+        )
+        schema_editor.execute(
+            'CREATE INDEX posts_post_search ON posts_post '
+            'USING GIN (search_vector)'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE posts_post_fts')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX posts_post_search')
+        schema_editor.execute(
+            'ALTER TABLE posts_post DROP COLUMN search_vector'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_storedimage'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
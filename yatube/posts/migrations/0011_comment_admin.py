@@ -0,0 +1,27 @@
+# Generated by Django 2.2.16 on 2026-10-17 05:06
+
+from django.db import migrations, models
+
+
+def fill_comment_counter(apps, schema_editor):
+    Comment = apps.get_model('posts', 'Comment')
+    TableCounter = apps.get_model('posts', 'TableCounter')
+    TableCounter.objects.update_or_create(
+        table=Comment._meta.db_table,
+        defaults={'rows': Comment.objects.count()}
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_post_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['-created'], name='posts_comment_created'),
+        ),
+        migrations.RunPython(fill_comment_counter, migrations.RunPython.noop),
+    ]
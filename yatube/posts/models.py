@@ -1,6 +1,10 @@
+import json
+
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from .storage import image_storage
+
 User = get_user_model()
 
 
@@ -21,6 +25,7 @@ class Post(models.Model):
                             help_text='Введите текст поста'
                             )
     pub_date = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -38,18 +43,67 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=image_storage,
         blank=True,
         null=True
     )
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки', blank=True, null=True, editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки', blank=True, null=True, editable=False
+    )
+    image_size = models.PositiveIntegerField(
+        'Размер файла картинки', blank=True, null=True, editable=False
+    )
+    image_format = models.CharField(
+        'Формат картинки', max_length=10, blank=True, editable=False
+    )
+    image_hash = models.CharField(
+        'SHA-256 картинки', max_length=64, blank=True, editable=False
+    )
+    image_variants = models.TextField(
+        'Адаптивные варианты картинки',
+        blank=True,
+        default='',
+        help_text='JSON {формат: [[ширина, файл], ...]}, пишется фоном'
+    )
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(fields=('-pub_date',), name='posts_post_date'),
+            models.Index(
+                fields=('author', '-pub_date'),
+                name='posts_post_author_date'
+            ),
+            models.Index(
+                fields=('group', '-pub_date'),
+                name='posts_post_group_date'
+            ),
+        )
         verbose_name = 'Публикация'
         verbose_name_plural = 'Публикации'
 
     def __str__(self):
         return self.text[:15]
 
+    @property
+    def image_srcsets(self):
+        """Пары (MIME-тип, srcset) для <source> внутри <picture>."""
+        if not self.image or not self.image_variants:
+            return []
+        storage = self.image.storage
+        return [
+            (f'image/{image_format}', ', '.join(
+                f'{storage.url(name)} {width}w' for width, name in variants
+            ))
+            for image_format, variants in json.loads(
+                self.image_variants
+            ).items()
+            if variants
+        ]
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -78,6 +132,13 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ('-created',)
+        indexes = (
+            models.Index(
+                fields=('post', '-created'),
+                name='posts_comment_post_created'
+            ),
+            models.Index(fields=('-created',), name='posts_comment_created'),
+        )
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
 
@@ -98,8 +159,145 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ('user', 'author',)
+        indexes = (
+            models.Index(
+                fields=('author', 'user'),
+                name='posts_follow_author_user'
+            ),
+        )
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
 
     def __str__(self):
         return self.author
+
+
+class TimelineEntry(models.Model):
+    """Запись персональной ленты подписчика (fan-out on write)."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост',
+    )
+    # копия Post.pub_date: лента читается одним проходом по индексу
+    pub_date = models.DateTimeField('Дата публикации поста')
+
+    class Meta:
+        unique_together = ('user', 'post',)
+        indexes = (
+            models.Index(
+                fields=('user', 'author'),
+                name='posts_timeline_user_author'
+            ),
+            models.Index(
+                fields=('user', '-pub_date'),
+                name='posts_timeline_user_date'
+            ),
+        )
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+
+    def __str__(self):
+        return f'{self.user_id}: {self.post_id}'
+
+
+class AuthorStats(models.Model):
+    """Денормализованные счётчики пользователя."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь',
+    )
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+    comments_count = models.PositiveIntegerField('Комментариев', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+
+    class Meta:
+        verbose_name = 'Счётчики автора'
+        verbose_name_plural = 'Счётчики авторов'
+
+    def __str__(self):
+        return f'{self.user_id}'
+
+
+class TableCounter(models.Model):
+    """Поддерживаемое сигналами число строк таблицы."""
+    table = models.CharField('Таблица', max_length=100, primary_key=True)
+    rows = models.BigIntegerField('Строк', default=0)
+
+    class Meta:
+        verbose_name = 'Счётчик таблицы'
+        verbose_name_plural = 'Счётчики таблиц'
+
+    def __str__(self):
+        return f'{self.table}: {self.rows}'
+
+
+class StoredImage(models.Model):
+    """Число постов, ссылающихся на файл картинки: одинаковые
+    загрузки хранятся одним файлом."""
+    name = models.CharField('Файл', max_length=100, primary_key=True)
+    refs = models.PositiveIntegerField('Ссылок', default=0)
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'Файлы картинок'
+
+    def __str__(self):
+        return f'{self.name}: {self.refs}'
+
+
+class DeletionJob(models.Model):
+    """Фоновое удаление объекта с зависимыми строками пачками."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+
+    model = models.CharField('Модель', max_length=100)
+    object_id = models.PositiveIntegerField('Идентификатор объекта')
+    object_repr = models.CharField('Объект', max_length=200)
+    status = models.CharField(
+        'Состояние', max_length=10, choices=STATUSES, default=PENDING
+    )
+    step = models.CharField('Этап', max_length=100, blank=True)
+    deleted = models.PositiveIntegerField('Обработано строк', default=0)
+    error = models.TextField('Ошибка', blank=True)
+    created = models.DateTimeField('Создано', auto_now_add=True)
+    updated = models.DateTimeField('Обновлено', auto_now=True)
+
+    class Meta:
+        ordering = ('-created',)
+        indexes = (
+            models.Index(
+                fields=('model', 'object_id'),
+                name='posts_deletionjob_object'
+            ),
+        )
+        verbose_name = 'Удаление'
+        verbose_name_plural = 'Удаления'
+
+    def __str__(self):
+        return f'{self.model} {self.object_repr}: {self.get_status_display()}'
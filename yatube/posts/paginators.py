@@ -0,0 +1,158 @@
+from django.conf import settings
+from django.core import signing
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from .counters import estimated_count
+
+NEXT = 'n'
+PREVIOUS = 'p'
+CURSOR_SALT = 'posts.paginators.cursor'
+ELLIPSIS = '…'
+
+
+class PostPaginator(Paginator):
+    """Паджинатор с окном номеров страниц вместо полного page_range."""
+    ELLIPSIS = ELLIPSIS
+
+    def get_elided_page_range(self, number=1, on_each_side=2, on_ends=1):
+        """Текущая страница ±on_each_side, крайние страницы и многоточия."""
+        number = self.validate_number(number)
+        if self.num_pages <= (on_each_side + on_ends) * 2:
+            yield from self.page_range
+            return
+        if number > (1 + on_each_side + on_ends) + 1:
+            yield from range(1, on_ends + 1)
+            yield ELLIPSIS
+            yield from range(number - on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+        if number < (self.num_pages - on_each_side - on_ends) - 1:
+            yield from range(number + 1, number + on_each_side + 1)
+            yield ELLIPSIS
+            yield from range(self.num_pages - on_ends + 1, self.num_pages + 1)
+        else:
+            yield from range(number + 1, self.num_pages + 1)
+
+
+class EstimatedCountPaginator(PostPaginator):
+    """Для больших нефильтрованных лент берёт оценку вместо COUNT(*).
+
+    Маленькие ленты (группы, профили) считаются точно.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = None
+        if hasattr(self.object_list, 'query'):
+            estimate = estimated_count(self.object_list)
+        if estimate is not None and estimate > settings.EXACT_COUNT_LIMIT:
+            return estimate
+        return super().count
+
+
+class CursorPage(Page):
+    """Страница курсорного паджинатора: только «вперёд» и «назад»."""
+
+    def __init__(self, object_list, paginator, next_cursor=None,
+                 previous_cursor=None):
+        super().__init__(object_list, None, paginator)
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<Cursor page>'
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class CursorPaginator(Paginator):
+    """Паджинатор по ключу (field, id) без COUNT(*) и OFFSET.
+
+    Позиция передаётся непрозрачным токеном в параметре ?cursor=;
+    токен подписан, поэтому принимаются только выданные сайтом.
+    """
+    cursor_mode = True
+
+    def __init__(self, object_list, per_page, field='pub_date'):
+        super().__init__(object_list, per_page)
+        self.field = field
+
+    def encode_cursor(self, obj, direction):
+        value = getattr(obj, self.field).isoformat()
+        return signing.dumps([value, obj.pk, direction], salt=CURSOR_SALT)
+
+    def decode_cursor(self, cursor):
+        try:
+            value, pk, direction = signing.loads(cursor, salt=CURSOR_SALT)
+            value = parse_datetime(value)
+            pk = int(pk)
+        except (signing.BadSignature, TypeError, ValueError):
+            return None
+        if value is None or direction not in (NEXT, PREVIOUS):
+            return None
+        return value, pk, direction
+
+    def _after(self, value, pk):
+        field = self.field
+        return self.object_list.filter(
+            Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk})
+        ).order_by(f'-{field}', '-pk')
+
+    def _before(self, value, pk):
+        field = self.field
+        return self.object_list.filter(
+            Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk})
+        ).order_by(field, 'pk')
+
+    def first_page_query(self):
+        # на строку больше страницы: по ней видно, есть ли следующая
+        return self.object_list.order_by(
+            f'-{self.field}', '-pk'
+        )[:self.per_page + 1]
+
+    def first_page(self):
+        rows = list(self.first_page_query())
+        next_cursor = None
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            next_cursor = self.encode_cursor(rows[-1], NEXT)
+        return CursorPage(rows, self, next_cursor=next_cursor)
+
+    def get_cursor_page(self, cursor):
+        """Возвращает страницу по токену; битый токен — первая страница."""
+        position = self.decode_cursor(cursor) if cursor else None
+        if position is None:
+            return self.first_page()
+        value, pk, direction = position
+        if direction == NEXT:
+            rows = list(self._after(value, pk)[:self.per_page + 1])
+            has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+        else:
+            rows = list(self._before(value, pk)[:self.per_page + 1])
+            has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+        if not rows:
+            return self.first_page()
+        if direction == NEXT:
+            next_cursor = (
+                self.encode_cursor(rows[-1], NEXT) if has_more else None
+            )
+            previous_cursor = self.encode_cursor(rows[0], PREVIOUS)
+        else:
+            next_cursor = self.encode_cursor(rows[-1], NEXT)
+            previous_cursor = (
+                self.encode_cursor(rows[0], PREVIOUS) if has_more else None
+            )
+        return CursorPage(
+            rows, self,
+            next_cursor=next_cursor,
+            previous_cursor=previous_cursor
+        )
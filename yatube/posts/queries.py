@@ -0,0 +1,35 @@
+"""Выборки страниц сайта. Их используют вьюхи и explain_feeds, чтобы
+планы запросов печатались ровно для того, что выполняет сайт."""
+from .counters import related_count
+from .models import Comment, Post
+from .timeline import timeline_posts
+
+
+def index_posts():
+    return Post.objects.select_related('group', 'author')
+
+
+def group_posts(group):
+    return group.posts.select_related('group', 'author')
+
+
+def profile_posts(author):
+    return Post.objects.select_related('author', 'group').filter(
+        author=author
+    )
+
+
+def follow_posts(user, popular=None):
+    return timeline_posts(user, popular).select_related('group', 'author')
+
+
+def post_with_counts():
+    # пост, автор, группа и оба счётчика приходят одним запросом
+    return Post.objects.select_related('author__stats', 'group').annotate(
+        comment_count=related_count(Comment, 'post')
+    )
+
+
+def post_comments(post_id):
+    # авторы комментариев — одним JOIN
+    return Comment.objects.select_related('author').filter(post_id=post_id)
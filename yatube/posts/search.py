@@ -0,0 +1,99 @@
+"""Полнотекстовый поиск по постам.
+
+SQLite: таблица FTS5 posts_post_fts с основами слов (см. stemmer),
+синхронизируется сигналами Post. PostgreSQL: вычисляемая колонка
+posts_post.search_vector (to_tsvector('russian', text)) с GIN-индексом,
+её база обновляет сама. Остальные базы ищут через LIKE.
+"""
+from django.db import connection
+
+from .models import Post
+from .stemmer import stem_words
+
+FTS_TABLE = 'posts_post_fts'
+
+
+def search_document(text):
+    return ' '.join(stem_words(text))
+
+
+def fts_query(query):
+    # все основы должны встретиться; кавычки экранируют синтаксис FTS5
+    return ' '.join(f'"{word}"' for word in stem_words(query))
+
+
+def index_post(post):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, body) VALUES (%s, %s)',
+            [post.pk, search_document(post.text)]
+        )
+
+
+def unindex_post(pk):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [pk])
+
+
+def rebuild_index(batch_size=1000):
+    """Переиндексирует все посты пачками; возвращает их число."""
+    if connection.vendor != 'sqlite':
+        return Post.objects.count()
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        last_pk, total = 0, 0
+        while True:
+            batch = list(
+                Post.objects.filter(pk__gt=last_pk).order_by('pk').values_list(
+                    'pk', 'text'
+                )[:batch_size]
+            )
+            if not batch:
+                return total
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, body) VALUES (%s, %s)',
+                [(pk, search_document(text)) for pk, text in batch]
+            )
+            total += len(batch)
+            last_pk = batch[-1][0]
+
+
+def search_posts(query):
+    """Посты, подходящие под запрос, от самых релевантных.
+
+    У каждого поста есть атрибут rank; чем он меньше, тем пост выше.
+    """
+    posts = Post.objects.order_by()
+    if connection.vendor == 'sqlite':
+        match = fts_query(query)
+        if not match:
+            return posts.none()
+        return posts.extra(
+            select={'rank': f'bm25({FTS_TABLE})'},
+            tables=[FTS_TABLE],
+            where=[
+                f'{FTS_TABLE}.rowid = posts_post.id',
+                f'{FTS_TABLE} MATCH %s',
+            ],
+            params=[match],
+            order_by=['rank', '-pub_date'],
+        )
+    if not query.strip():
+        return posts.none()
+    if connection.vendor == 'postgresql':
+        tsquery = "plainto_tsquery('russian', %s)"
+        return posts.extra(
+            select={'rank': f'-ts_rank_cd(search_vector, {tsquery})'},
+            select_params=[query],
+            where=[f'search_vector @@ {tsquery}'],
+            params=[query],
+            order_by=['rank', '-pub_date'],
+        )
+    return posts.filter(text__icontains=query).extra(
+        select={'rank': '0'}
+    ).order_by('-pub_date')
@@ -0,0 +1,127 @@
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import counters, search, timeline
+from .cache import forget_group_choices, purge_post, purge_tags
+from .images import acquire_image, release_image
+from .models import AuthorStats, Comment, Follow, Group, Post, User
+from .uploads import EMPTY_IMAGE_METADATA, image_metadata
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        AuthorStats.objects.get_or_create(user=instance)
+    elif update_fields != frozenset(('last_login',)):
+        # имя автора есть на карточках его постов
+        purge_tags(f'author-{instance.pk}')
+
+
+@receiver(post_init, sender=Post)
+def post_loaded(sender, instance, **kwargs):
+    # прежняя группа: при переносе поста сбрасывается и её лента
+    instance._loaded_group_id = instance.__dict__.get('group_id')
+    # прежняя картинка: при замене её файл отпускается; None — поле
+    # отложено (only/defer), тогда имя читается из базы
+    if 'image' in instance.__dict__:
+        image = instance.__dict__['image']
+        instance._loaded_image = getattr(image, 'name', image) or ''
+    else:
+        instance._loaded_image = None
+
+
+@receiver(pre_save, sender=Post)
+def post_image_metadata(sender, instance, **kwargs):
+    # метаданные читаются только из свежей загрузки, файл ещё в памяти
+    # или во временном файле, хранилище не трогаем
+    if not instance.image:
+        metadata = EMPTY_IMAGE_METADATA
+    elif not instance.image._committed:
+        metadata = image_metadata(instance.image.file)
+    else:
+        return
+    for field, value in metadata.items():
+        setattr(instance, field, value)
+    if not instance._state.adding:
+        # картинку убрали или заменили: прежний файл отпустим после save
+        replaced = instance._loaded_image
+        if replaced is None:
+            replaced = Post.objects.filter(
+                pk=instance.pk
+            ).values_list('image', flat=True).first() or ''
+        instance._replaced_image = replaced
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    image = instance.image.name if instance.image else ''
+    if created:
+        counters.bump(instance.author_id, posts_count=1)
+        counters.bump_table(Post, 1)
+        timeline.fan_out(instance)
+        if image:
+            acquire_image(image)
+    replaced = instance.__dict__.pop('_replaced_image', image)
+    if replaced != image:
+        if image:
+            acquire_image(image)
+        if replaced:
+            release_image(replaced)
+    search.index_post(instance)
+    old_group_id = instance._loaded_group_id
+    purge_post(
+        instance, old_group_id if old_group_id != instance.group_id else None
+    )
+    instance._loaded_group_id = instance.group_id
+    instance._loaded_image = image
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.bump(instance.author_id, posts_count=-1)
+    counters.bump_table(Post, -1)
+    if instance.image:
+        release_image(instance.image.name)
+    search.unindex_post(instance.pk)
+    purge_post(instance)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.bump(instance.author_id, comments_count=1)
+        counters.bump_table(Comment, 1)
+    purge_tags(f'post-{instance.post_id}')
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.bump(instance.author_id, comments_count=-1)
+    counters.bump_table(Comment, -1)
+    purge_tags(f'post-{instance.post_id}')
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    forget_group_choices()
+    purge_tags(f'group-{instance.pk}')
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        counters.bump(instance.user_id, following_count=1)
+        counters.bump(instance.author_id, followers_count=1)
+        timeline.backfill(instance)
+    purge_tags(f'follow-{instance.user_id}')
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.bump(instance.user_id, following_count=-1)
+    counters.bump(instance.author_id, followers_count=-1)
+    timeline.prune(instance)
+    timeline.refill_if_unpopular(instance.author_id)
+    purge_tags(f'follow-{instance.user_id}')
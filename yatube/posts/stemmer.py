@@ -0,0 +1,80 @@
+"""Стеммер Портера (Snowball) для русского языка.
+
+Нужен индексу SQLite: у FTS5 нет русской морфологии, поэтому в индекс
+и в запрос попадают уже обрезанные до основы слова. PostgreSQL
+обходится своей конфигурацией 'russian'.
+"""
+import re
+
+VOWELS = 'аеиоуыэюя'
+
+RV = re.compile(f'^(.*?[{VOWELS}])(.*)$')
+PERFECTIVE_GERUND = re.compile(
+    r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$'
+)
+REFLEXIVE = re.compile(r'(с[яь])$')
+ADJECTIVE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых'
+    r'|ую|юю|ая|яя|ою|ею)$'
+)
+PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло'
+    r'|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)'
+    r'|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+)
+NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием'
+    r'|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+DERIVATIONAL = re.compile(f'.*[^{VOWELS}]+[{VOWELS}].*ость?$')
+DERIVATIONAL_ENDING = re.compile(r'ость?$')
+SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+I_ENDING = re.compile('и$')
+SOFT_SIGN = re.compile('ь$')
+DOUBLE_N = re.compile('нн$')
+WORD = re.compile(r'[^\W_]+')
+
+
+def _cut(pattern, word):
+    return pattern.sub('', word, 1)
+
+
+def stem(word):
+    """Основа слова; слова без русских гласных возвращаются как есть."""
+    word = word.lower().replace('ё', 'е')
+    match = RV.match(word)
+    if match is None:
+        return word
+    prefix, rv = match.groups()
+    # шаг 1: деепричастие, иначе возвратность и прилагательное,
+    # глагол или существительное
+    cut = _cut(PERFECTIVE_GERUND, rv)
+    if cut == rv:
+        rv = _cut(REFLEXIVE, rv)
+        cut = _cut(ADJECTIVE, rv)
+        if cut != rv:
+            rv = _cut(PARTICIPLE, cut)
+        else:
+            cut = _cut(VERB, rv)
+            rv = _cut(NOUN, rv) if cut == rv else cut
+    else:
+        rv = cut
+    # шаг 2
+    rv = _cut(I_ENDING, rv)
+    # шаг 3: словообразовательный суффикс в R2
+    if DERIVATIONAL.match(rv):
+        rv = _cut(DERIVATIONAL_ENDING, rv)
+    # шаг 4
+    cut = _cut(SOFT_SIGN, rv)
+    if cut == rv:
+        rv = _cut(SUPERLATIVE, rv)
+        rv = DOUBLE_N.sub('н', rv, 1)
+    else:
+        rv = cut
+    return prefix + rv
+
+
+def stem_words(text):
+    """Основы всех слов текста в порядке появления."""
+    return [stem(word) for word in WORD.findall(text)]
@@ -0,0 +1,54 @@
+"""Хранилище картинок постов с именами по хэшу содержимого."""
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Сохраняет файл как <каталог>/<sha256>.<расширение>.
+
+    Одинаковые загрузки получают одно имя и один файл на диске, а значит
+    и одни миниатюры sorl. Удалять файл можно только когда на него
+    не осталось ссылок — за этим следит posts.images.release_image.
+    """
+
+    def content_name(self, name, content):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(directory, content_hash(content) + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            try:
+                # новое mtime: сборщик мусора с --min-age не тронет файл,
+                # пока пост с повторной загрузкой ещё не сохранён
+                os.utime(self.path(name))
+                return name
+            except FileNotFoundError:
+                pass
+        saved = self._save(name, content)
+        if saved != name:
+            # такой же файл записали параллельно, пока писали мы
+            self.delete(saved)
+        return name
+
+
+image_storage = ContentAddressedStorage()
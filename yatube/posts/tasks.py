@@ -0,0 +1,106 @@
+"""Фоновые задачи вне потока запроса.
+
+Картинки режутся в пуле 'images', задания удаления идут в отдельном
+пуле 'jobs': долгое удаление не задерживает миниатюры. Короткие
+сетевые вызовы (PURGE прокси) отправляет поток, без процессов.
+"""
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# пул -> настройка с числом процессов
+POOLS = {
+    'images': 'THUMBNAIL_POOL_WORKERS',
+    'jobs': 'JOB_POOL_WORKERS',
+}
+
+_executors = {}
+_thread_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def _workers(pool):
+    return getattr(settings, POOLS[pool])
+
+
+def get_executor(pool='images'):
+    with _lock:
+        if pool not in _executors:
+            _executors[pool] = ProcessPoolExecutor(
+                max_workers=_workers(pool),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker
+            )
+    return _executors[pool]
+
+
+def get_thread_executor():
+    global _thread_executor
+    with _lock:
+        if _thread_executor is None:
+            # один поток: вызовы уходят по порядку и не копятся
+            _thread_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='background'
+            )
+    return _thread_executor
+
+
+def _finish(key, callback, future):
+    try:
+        callback(future.result())
+    except Exception:
+        logger.exception('Фоновая задача %s не выполнена', key)
+    finally:
+        with _lock:
+            _pending.discard(key)
+
+
+def _claim(key):
+    with _lock:
+        if key in _pending:
+            return False
+        _pending.add(key)
+        return True
+
+
+def run_in_pool(key, func, args, callback, pool='images'):
+    """Выполняет func(*args) в пуле pool, результат отдаёт callback в
+    этом процессе. Задача с тем же key, пока не завершена, не
+    дублируется.
+
+    Если в настройке пула 0 процессов, всё выполняется сразу
+    (разработка).
+    """
+    if not _claim(key):
+        return
+    if not _workers(pool):
+        future = Future()
+        try:
+            future.set_result(func(*args))
+        except Exception as error:
+            future.set_exception(error)
+        _finish(key, callback, future)
+        return
+    # воркеры читают настройки сами при django.setup()
+    future = get_executor(pool).submit(func, *args)
+    future.add_done_callback(partial(_finish, key, callback))
+
+
+def run_in_thread(key, func, args, callback):
+    """То же, что run_in_pool, но в фоновом потоке этого процесса."""
+    if not _claim(key):
+        return
+    future = get_thread_executor().submit(func, *args)
+    future.add_done_callback(partial(_finish, key, callback))
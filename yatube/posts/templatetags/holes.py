@@ -0,0 +1,18 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from ..fragments import hole_marker, render_fragment
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, name, **kwargs):
+    """Пользовательский фрагмент страницы. При рендере оболочки для
+    кэша (request.page_shell) оставляет метку, иначе рендерит сразу."""
+    request = context.get('request')
+    if request is None:
+        return ''
+    if getattr(request, 'page_shell', False):
+        return mark_safe(hole_marker(name, kwargs))
+    return render_fragment(request, name, kwargs)
@@ -1,18 +1,23 @@
 import shutil
 import tempfile
 from http import HTTPStatus
+from io import BytesIO
 
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.db.models import F
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
 from django.urls import reverse
+from PIL import Image
 
-from ..models import Follow, Group, Post, User
+from ..forms import PostForm
+from ..models import Follow, Group, Post, TimelineEntry, User
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_POOL_WORKERS=0)
 class PostFormTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -170,6 +175,62 @@ class PostFormTests(TestCase):
         self.assertEqual(response.status_code, HTTPStatus.OK)
         self.assertEqual(Post.objects.count(), count_posts + 1)
 
+    @staticmethod
+    def get_photo(size, image_format='JPEG', **options):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, image_format, **options)
+        return SimpleUploadedFile(
+            f'photo.{image_format.lower()}',
+            buffer.getvalue(),
+            content_type=f'image/{image_format.lower()}'
+        )
+
+    @override_settings(POST_IMAGE_MAX_SIDE=100)
+    def test_large_photo_downscaled_without_exif(self):
+        """Большое фото уменьшается, поворачивается по EXIF
+        и сохраняется без EXIF."""
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: повернуть на 90°
+        exif[0x010F] = 'Camera'
+        form = PostForm(
+            data={'text': 'Фото'},
+            files={'image': self.get_photo((400, 300), exif=exif.tobytes())}
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        post = form.save(commit=False)
+        post.author = self.user
+        post.save()
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (75, 100))
+            self.assertNotIn('exif', image.info)
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=10000)
+    def test_too_many_pixels_rejected_by_header(self):
+        form = PostForm(
+            data={'text': 'Фото'},
+            files={'image': self.get_photo((200, 200), 'PNG')}
+        )
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors.as_data()['image'][0].code,
+                         'too_many_pixels')
+
+    @override_settings(
+        POST_IMAGE_MAX_SIDE=100, POST_IMAGE_MAX_DECODE_PIXELS=5000
+    )
+    def test_jpeg_decoded_in_draft_mode(self):
+        """JPEG уменьшается при декодировании, PNG того же размера
+        в лимит декодирования не влезает."""
+        jpeg = PostForm(
+            data={'text': 'Фото'},
+            files={'image': self.get_photo((800, 400))}
+        )
+        self.assertTrue(jpeg.is_valid(), jpeg.errors)
+        png = PostForm(
+            data={'text': 'Фото'},
+            files={'image': self.get_photo((800, 400), 'PNG')}
+        )
+        self.assertFalse(png.is_valid())
+
 
 class FollowAndCommentsTests(TestCase):
     def setUp(self):
@@ -251,3 +312,94 @@ class FollowAndCommentsTests(TestCase):
             response,
             'Тестовая новая запись в ленте'
         )
+
+    def test_timeline_filled_on_post_and_pruned_on_unfollow(self):
+        "Лента подписчика заполняется при публикации и чистится при отписке"
+        self.client_auth_follower.get(
+            reverse(
+                'posts:profile_follow',
+                kwargs={'username': self.user_following.username}
+            )
+        )
+        new_post = Post.objects.create(
+            author=self.user_following,
+            text='Свежая запись'
+        )
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(
+                user=self.user_follower
+            ).values_list('post_id', flat=True)),
+            {self.post.pk, new_post.pk}
+        )
+        self.client_auth_follower.get(
+            reverse(
+                'posts:profile_unfollow',
+                kwargs={'username': self.user_following.username}
+            )
+        )
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.user_follower).exists()
+        )
+        response = self.client_auth_follower.get('/follow/')
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+    def test_timeline_pages_by_entry_date(self):
+        "Лента подписок листается по дате записи ленты"
+        Follow.objects.create(user=self.user_follower,
+                              author=self.user_following)
+        for i in range(10):
+            Post.objects.create(author=self.user_following, text=f'Пост {i}')
+        self.assertFalse(TimelineEntry.objects.exclude(
+            pub_date=F('post__pub_date')
+        ).exists())
+        first = self.client_auth_follower.get(
+            '/follow/', {'cursor': ''}
+        ).context['page_obj']
+        self.assertEqual(first[0].text, 'Пост 9')
+        second = self.client_auth_follower.get(
+            '/follow/', {'cursor': first.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(
+            [post.text for post in second], ['Тестовая новая запись в ленте']
+        )
+        self.assertFalse(second.has_next())
+        numbered = self.client_auth_follower.get(
+            '/follow/', {'page': 2}
+        ).context['page_obj']
+        self.assertEqual(numbered.paginator.count, 11)
+        self.assertEqual(list(numbered), list(second))
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_popular_author_read_at_request_time(self):
+        "Посты популярного автора читаются при запросе, а не из ленты"
+        Follow.objects.create(user=self.user_follower,
+                              author=self.user_following)
+        Post.objects.create(author=self.user_following, text='Популярное')
+        self.assertFalse(TimelineEntry.objects.exists())
+        response = self.client_auth_follower.get('/follow/')
+        self.assertEqual(len(response.context['page_obj']), 2)
+
+
+@override_settings(TIMELINE_FANOUT_LIMIT=1, JOB_POOL_WORKERS=0)
+class TimelineRefillTests(TransactionTestCase):
+    def test_author_no_longer_popular(self):
+        "Автор опустился до порога: его посты появляются в лентах"
+        author = User.objects.create_user(username='author')
+        reader = User.objects.create_user(username='reader')
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=reader, author=author)
+        Follow.objects.create(user=other, author=author)
+        post = Post.objects.create(author=author, text='Пока популярен')
+        self.assertFalse(TimelineEntry.objects.exists())
+        client = Client()
+        client.force_login(other)
+        client.get(
+            reverse('posts:profile_unfollow', kwargs={'username': 'author'})
+        )
+        self.assertEqual(
+            list(TimelineEntry.objects.values_list('user', 'post')),
+            [(reader.pk, post.pk)]
+        )
+        client.force_login(reader)
+        response = client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [post])
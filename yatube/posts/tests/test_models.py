@@ -1,7 +1,30 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
 
-from ..models import Group, Post
+from ..deletion import schedule_deletion
+from ..management.commands.collect_media_garbage import Command
+from ..management.commands.explain_feeds import Command as ExplainCommand
+from ..images import variant_name
+from ..models import (AuthorStats, Comment, DeletionJob, Follow, Group, Post,
+                      StoredImage)
+from ..storage import image_storage
 
 User = get_user_model()
 
@@ -39,3 +62,362 @@ class PostModelTest(TestCase):
             with self.subTest(field=field):
                 self.assertEqual(
                     task._meta.get_field(field).verbose_name, expected_value)
+
+
+class AuthorStatsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def assertStats(self, user, **expected):
+        stats = AuthorStats.objects.get(user=user)
+        for name, value in expected.items():
+            with self.subTest(name=name):
+                self.assertEqual(getattr(stats, name), value)
+
+    def test_counters_follow_creates_and_deletes(self):
+        """Счётчики меняются при создании и удалении объектов."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader, text='Ок')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertStats(self.author, posts_count=1, followers_count=1)
+        self.assertStats(self.reader, comments_count=1, following_count=1)
+        follow.delete()
+        post.delete()
+        self.assertStats(self.author, posts_count=0, followers_count=0)
+        self.assertStats(self.reader, comments_count=0, following_count=0)
+
+    def test_rebuild_counters_command(self):
+        """Команда rebuild_counters чинит разъехавшиеся счётчики."""
+        Post.objects.create(author=self.author, text='Пост')
+        AuthorStats.objects.filter(user=self.author).update(posts_count=42)
+        AuthorStats.objects.filter(user=self.reader).delete()
+        call_command('rebuild_counters', batch_size=1, stdout=StringIO())
+        self.assertStats(self.author, posts_count=1)
+        self.assertStats(self.reader, posts_count=0)
+
+
+class ExplainFeedsCommandTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, group=cls.group, text='Пост'
+        )
+
+    def test_queries_match_views(self):
+        """Планы печатаются для тех же выборок, что выполняют вьюхи."""
+        queries = ExplainCommand().get_queries(
+            self.user, self.group, self.post
+        )
+        self.assertIn('group', queries['profile'].query.select_related)
+        post_detail = queries['post_detail'].query
+        self.assertIn('group', post_detail.select_related)
+        self.assertIn('comment_count', post_detail.annotations)
+        comments = queries['post_detail comments'].query
+        self.assertEqual(comments.order_by, ('-created', '-pk'))
+        self.assertEqual(comments.high_mark, settings.COMMENT_LIMIT + 1)
+        self.assertIn('author', comments.select_related)
+
+    def test_feeds_use_composite_indexes(self):
+        """Ленты автора и группы читаются по составным индексам."""
+        out = StringIO()
+        call_command('explain_feeds', stdout=out)
+        output = out.getvalue()
+        for index in ('posts_post_author_date', 'posts_post_group_date'):
+            with self.subTest(index=index):
+                self.assertIn(index, output)
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_POOL_WORKERS=0)
+class ImageMetadataTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        buffer = BytesIO()
+        Image.new('RGB', (30, 20), 'red').save(buffer, 'PNG')
+        cls.content = buffer.getvalue()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_metadata_saved_on_upload(self):
+        post = Post.objects.create(
+            author=self.user,
+            text='Пост',
+            image=SimpleUploadedFile('photo.png', self.content)
+        )
+        post.refresh_from_db()
+        self.assertEqual(
+            (post.image_width, post.image_height, post.image_size),
+            (30, 20, len(self.content))
+        )
+        self.assertEqual(post.image_format, 'png')
+        self.assertEqual(
+            post.image_hash, hashlib.sha256(self.content).hexdigest()
+        )
+        post.image = None
+        post.save()
+        self.assertIsNone(post.image_width)
+        self.assertEqual(post.image_hash, '')
+
+    def test_text_edit_skips_image_lookup(self):
+        """Прежняя картинка известна с загрузки поста, её не перечитывают."""
+        Post.objects.create(author=self.user, text='Пост')
+        post = Post.objects.get()
+        post.text = 'Правка'
+        with CaptureQueriesContext(connection) as queries:
+            post.save()
+        self.assertFalse([
+            query for query in queries
+            if query['sql'].startswith('SELECT "posts_post"."image"')
+        ])
+
+    def test_backfill_command(self):
+        """Команда заполняет старые посты и пропускает потерянные файлы."""
+        post = Post.objects.create(
+            author=self.user,
+            text='Пост',
+            image=SimpleUploadedFile('photo.png', self.content)
+        )
+        Post.objects.filter(pk=post.pk).update(image_width=None, image_hash='')
+        lost = Post.objects.create(
+            author=self.user, text='Пост', image='posts/lost.png'
+        )
+        call_command('backfill_image_metadata', stdout=StringIO(),
+                     stderr=StringIO())
+        post.refresh_from_db()
+        lost.refresh_from_db()
+        self.assertEqual(post.image_width, 30)
+        self.assertEqual(
+            post.image_hash, hashlib.sha256(self.content).hexdigest()
+        )
+        self.assertEqual(lost.image_hash, '')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_POOL_WORKERS=0)
+class StoredImageTest(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        buffer = BytesIO()
+        Image.new('RGB', (30, 20), 'blue').save(buffer, 'PNG')
+        self.content = buffer.getvalue()
+
+    def create_post(self, filename):
+        return Post.objects.create(
+            author=self.user,
+            text='Мем',
+            image=SimpleUploadedFile(filename, self.content)
+        )
+
+    def test_identical_uploads_share_file_until_last_delete(self):
+        """Одинаковые загрузки — один файл, удаляется с последним постом."""
+        first = self.create_post('meme.png')
+        second = self.create_post('repost.PNG')
+        name = f'posts/{hashlib.sha256(self.content).hexdigest()}.png'
+        self.assertEqual(first.image.name, name)
+        self.assertEqual(second.image.name, name)
+        self.assertEqual(StoredImage.objects.get(name=name).refs, 2)
+        first.delete()
+        self.assertTrue(second.image.storage.exists(name))
+        self.assertEqual(StoredImage.objects.get(name=name).refs, 1)
+        second.delete()
+        self.assertFalse(second.image.storage.exists(name))
+        self.assertFalse(StoredImage.objects.filter(name=name).exists())
+
+    def test_replaced_image_released(self):
+        post = self.create_post('meme.png')
+        old_name = post.image.name
+        buffer = BytesIO()
+        Image.new('RGB', (30, 20), 'green').save(buffer, 'PNG')
+        post.image = SimpleUploadedFile('other.png', buffer.getvalue())
+        post.save()
+        self.assertFalse(post.image.storage.exists(old_name))
+        self.assertEqual(StoredImage.objects.get(name=post.image.name).refs, 1)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_POOL_WORKERS=0)
+class CollectMediaGarbageTest(TestCase):
+    def tearDown(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        user = User.objects.create_user(username='auth')
+        buffer = BytesIO()
+        Image.new('RGB', (30, 20), 'red').save(buffer, 'PNG')
+        self.post = Post.objects.create(
+            author=user,
+            text='Пост',
+            image=SimpleUploadedFile('photo.png', buffer.getvalue())
+        )
+        self.orphan = default_storage.save('posts/orphan.png', ContentFile(
+            b'orphan'
+        ))
+        self.variant = default_storage.save(
+            variant_name('posts/orphan.png', 480, 'webp'), ContentFile(b'v')
+        )
+        self.kept_variant = default_storage.save(
+            variant_name(self.post.image.name, 480, 'webp'), ContentFile(b'v')
+        )
+        source = ImageFile('posts/gone.png', image_storage)
+        source.set_size((30, 20))
+        self.thumbnail = ImageFile(
+            default_storage.save('cache/aa/bb/gone.png', ContentFile(b't'))
+        )
+        self.thumbnail.set_size((10, 10))
+        default.kvstore.set(source)
+        default.kvstore.set(self.thumbnail, source)
+
+    def collect(self, *args):
+        call_command(
+            'collect_media_garbage', '--min-age=0', '--rate=0', *args,
+            stdout=StringIO()
+        )
+
+    def test_dry_run_deletes_nothing(self):
+        self.collect('--dry-run')
+        for name in (self.orphan, self.variant, self.thumbnail.name):
+            with self.subTest(name=name):
+                self.assertTrue(default_storage.exists(name))
+
+    def test_only_unreferenced_files_deleted(self):
+        self.collect('--batch-size=1')
+        for name in (self.orphan, self.variant, self.thumbnail.name):
+            with self.subTest(name=name):
+                self.assertFalse(default_storage.exists(name))
+        self.assertTrue(default_storage.exists(self.post.image.name))
+        self.assertTrue(default_storage.exists(self.kept_variant))
+        self.assertIsNone(default.kvstore.get(self.thumbnail))
+
+    def test_file_reused_during_pause_kept(self):
+        """Ссылки проверяются снова прямо перед удалением."""
+        user = self.post.author
+
+        def reuse(command):
+            if not Post.objects.filter(image=self.orphan).exists():
+                Post.objects.create(author=user, text='Ещё', image=self.orphan)
+
+        with mock.patch.object(Command, 'throttle', reuse):
+            self.collect()
+        self.assertTrue(default_storage.exists(self.orphan))
+        self.assertEqual(StoredImage.objects.get(name=self.orphan).refs, 1)
+
+    def test_duplicate_upload_refreshes_mtime(self):
+        path = image_storage.path(self.post.image.name)
+        os.utime(path, (0, 0))
+        with image_storage.open(self.post.image.name) as file:
+            name = image_storage.save('posts/again.png', file)
+        self.assertEqual(name, self.post.image.name)
+        self.assertGreater(os.path.getmtime(path), 0)
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    THUMBNAIL_POOL_WORKERS=0,
+    JOB_POOL_WORKERS=0,
+    DELETION_BATCH_SIZE=2
+)
+class DeletionJobTest(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        self.posts = [
+            Post.objects.create(
+                author=self.author, group=self.group, text=f'Пост {i}'
+            )
+            for i in range(5)
+        ]
+        self.other = Post.objects.create(author=self.reader, text='Чужой')
+        for post in self.posts[:3]:
+            Comment.objects.create(post=post, author=self.reader, text='Ок')
+        Comment.objects.create(post=self.other, author=self.author, text='!')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.author, author=self.reader)
+
+    def test_user_deleted_in_batches(self):
+        buffer = BytesIO()
+        Image.new('RGB', (30, 20), 'red').save(buffer, 'PNG')
+        post = self.posts[0]
+        post.image = SimpleUploadedFile('photo.png', buffer.getvalue())
+        post.save()
+        name = post.image.name
+        job = schedule_deletion(self.author)
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeletionJob.DONE)
+        # 4 комментария, 2 подписки, 5 постов и сам пользователь
+        self.assertEqual(job.deleted, 12)
+        self.assertFalse(User.objects.filter(username='author').exists())
+        self.assertEqual(list(Post.objects.all()), [self.other])
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(Follow.objects.exists())
+        self.assertFalse(image_storage.exists(name))
+        stats = AuthorStats.objects.get(user=self.reader)
+        self.assertEqual(stats.comments_count, 0)
+        self.assertEqual(stats.following_count, 0)
+        self.assertEqual(stats.followers_count, 0)
+
+    def test_group_posts_unlinked(self):
+        job = schedule_deletion(self.group)
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeletionJob.DONE)
+        self.assertFalse(Group.objects.exists())
+        self.assertEqual(Post.objects.count(), 6)
+        self.assertFalse(Post.objects.filter(group__isnull=False).exists())
+
+    def test_failed_job_resumes(self):
+        with mock.patch('posts.signals.timeline.prune') as prune, \
+                self.assertLogs('posts.deletion', 'ERROR'):
+            prune.side_effect = RuntimeError('сбой')
+            job = schedule_deletion(self.author)
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeletionJob.FAILED)
+        self.assertEqual(job.step, 'Подписки')
+        self.assertIn('сбой', job.error)
+        self.assertFalse(User.objects.get(pk=self.author.pk).is_active)
+        call_command(
+            'run_deletion_jobs', retry_failed=True, stdout=StringIO()
+        )
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeletionJob.DONE)
+        self.assertFalse(User.objects.filter(pk=self.author.pk).exists())
+
+    def test_single_post(self):
+        job = schedule_deletion(self.posts[0])
+        job.refresh_from_db()
+        self.assertEqual(job.deleted, 2)
+        self.assertEqual(Post.objects.count(), 5)
+        self.assertEqual(Comment.objects.count(), 3)
+
+    @override_settings(JOB_POOL_WORKERS=1)
+    def test_jobs_have_own_pool(self):
+        # удаление не занимает процессы, которые режут миниатюры
+        with mock.patch('posts.tasks.get_executor') as get_executor:
+            job = schedule_deletion(self.posts[0])
+        get_executor.assert_called_once_with('jobs')
+        get_executor.return_value.submit.assert_called_once_with(
+            mock.ANY, job.pk
+        )
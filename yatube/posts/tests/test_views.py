@@ -1,22 +1,66 @@
+import json
+import re
 import shutil
 import tempfile
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import BytesIO
+from unittest import mock
 
 from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.cache import cache
+from django.contrib.auth.models import Permission
+from django.contrib.messages import get_messages
+from django.core.cache import cache, caches
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.db import connection, transaction
+from django.test import (Client, RequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import urlsafe_base64_encode
+from PIL import Image
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore
 
-from ..models import Group, Post
+from ..cache import (SURROGATE_KEY, _is_fresh, _lock_key, _page_key,
+                     feed_stats, purge_tags)
+from ..cache_backend import (JOURNAL_ENTRY, JOURNAL_SEQ, L1Store,
+                             TwoTierCache)
+from ..fragments import fill_holes, hole_marker
+from ..images import queue_post_variants
+from ..kvstore import LRUKVStore
+from ..models import (Comment, DeletionJob, Follow, Group, Post,
+                      TableCounter)
+from ..paginators import ELLIPSIS, PostPaginator
+from ..storage import image_storage
+from ..tasks import get_thread_executor
 
 User = get_user_model()
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+# картинки хранятся под SHA-256 содержимого
+SMALL_GIF_NAME = (
+    'posts/'
+    'c8b24ca8dcbfc94990deafdb184f07dced6cb8be3f70ac6562ba36d5d14b06a5.gif'
+)
+CSRF_INPUT = re.compile(rb'name="csrfmiddlewaretoken" value="[^"]*"')
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+def view_rendered(response):
+    """Отработала ли вьюха; на закэшированной оболочке рендерятся
+    только пользовательские фрагменты."""
+    return 'page_obj' in (response.context or {})
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    THUMBNAIL_POOL_WORKERS=0
+)
 class PostContextTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -64,7 +108,7 @@ class PostContextTests(TestCase):
         self.assertEqual(first_object.author.username, 'author')
         self.assertEqual(first_object.group.title, 'Тестовая группа')
         # добавил проверку image
-        self.assertEqual(Post.objects.first().image, 'posts/small.gif')
+        self.assertEqual(Post.objects.first().image, SMALL_GIF_NAME)
 
     def test_group_list_correct_context(self):
         response = self.client.get(reverse('posts:group_list',
@@ -73,7 +117,7 @@ class PostContextTests(TestCase):
         self.assertEqual(first_object.text, 'Тестовый пост')
         self.assertEqual(first_object.author.username, 'author')
         self.assertEqual(first_object.group.title, 'Тестовая группа')
-        self.assertEqual(Post.objects.first().image, 'posts/small.gif')
+        self.assertEqual(Post.objects.first().image, SMALL_GIF_NAME)
 
     def test_post_detail_correct_context(self):
         response = self.client.get(reverse('posts:post_detail',
@@ -82,7 +126,7 @@ class PostContextTests(TestCase):
         self.assertEqual(first_object.text, 'Тестовый пост')
         self.assertEqual(first_object.author.username, 'author')
         self.assertEqual(first_object.group.title, 'Тестовая группа')
-        self.assertEqual(Post.objects.first().image, 'posts/small.gif')
+        self.assertEqual(Post.objects.first().image, SMALL_GIF_NAME)
 
     def test_post_create_correct_context(self):
         response = self.authorized_client.get(
@@ -106,7 +150,7 @@ class PostContextTests(TestCase):
         first_object = response.context['page_obj'][0]
         posts_text = first_object.text
         posts_image = Post.objects.first().image
-        self.assertEqual(posts_image, 'posts/small.gif')
+        self.assertEqual(posts_image, SMALL_GIF_NAME)
         self.assertEqual(response.context['author'].username, 'author')
         self.assertEqual(posts_text, 'Тестовый пост')
 
@@ -174,18 +218,25 @@ class PostContextTests(TestCase):
         )
         self.assertEqual(Post.objects.count(), posts_count + 1)
         # загруженная картинка соотсветствует картинке в модели
-        self.assertEqual(Post.objects.last().image, 'posts/small.gif')
+        self.assertEqual(Post.objects.last().image, SMALL_GIF_NAME)
         self.assertRedirects(response, reverse(
             'posts:profile',
             kwargs={'username': self.user.username})
         )
 
     def test_cache_is_working(self):
-        response_first = self.client.get(reverse("posts:index")).content
-        response_sec = self.client.get(reverse("posts:index")).content
+        def content():
+            # CSRF-токен в шапке маскируется заново для каждого ответа
+            return CSRF_INPUT.sub(
+                b'', self.client.get(reverse("posts:index")).content
+            )
+        response_first = content()
+        # update() обходит сигналы и не сбрасывает кэш
+        Post.objects.filter(pk=self.post.pk).update(text='Другой текст')
+        response_sec = content()
         self.assertEqual(response_first, response_sec)
         cache.clear()
-        response_third = self.client.get(reverse("posts:index")).content
+        response_third = content()
         self.assertNotEqual(response_sec, response_third)
 
 
@@ -242,3 +293,1009 @@ class PostPaginatorTests(TestCase):
         for template, reverse_name in paginator_list.items():
             response = self.guest_client.get(reverse_name)
             self.assertEqual(len(response.context['page_obj']), 3)
+
+
+@override_settings(THUMBNAIL_LRU_SIZE=2, THUMBNAIL_LRU_TIMEOUT=60)
+class LRUKVStoreTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.store = LRUKVStore()
+
+    def image(self, name):
+        image_file = ImageFile(name, image_storage)
+        image_file.set_size((960, 339))
+        return image_file
+
+    def test_repeat_reads_skip_shared_store(self):
+        """Повторное чтение ключа не ходит ни в кэш, ни в базу."""
+        source = self.image('posts/source.jpg')
+        self.store.set(source)
+        with mock.patch.object(KVStore, '_get_raw') as shared_get:
+            for _ in range(3):
+                self.assertEqual(self.store.get(source).size, [960, 339])
+        shared_get.assert_not_called()
+        self.assertEqual(self.store.stats()['hits'], 3)
+
+    def test_bounded_and_expiring(self):
+        for name in ('a', 'b', 'c'):
+            self.store.set(self.image(f'posts/{name}.jpg'))
+        stats = self.store.stats()
+        self.assertEqual((stats['size'], stats['evictions']), (2, 1))
+        with override_settings(THUMBNAIL_LRU_TIMEOUT=0):
+            self.store.set(self.image('posts/d.jpg'))
+        self.store.get(self.image('posts/d.jpg'))
+        self.assertEqual(self.store.stats()['expired'], 1)
+
+    def test_forget_drops_source_and_thumbnails(self):
+        source = self.image('posts/source.jpg')
+        thumbnail = self.image('cache/thumbnail.jpg')
+        self.store.set(source)
+        self.store.set(thumbnail, source)
+        self.store.forget(source)
+        self.assertEqual(self.store.stats()['size'], 0)
+        # в общем хранилище миниатюра осталась
+        self.assertIsNotNone(self.store.get(thumbnail))
+
+
+class TwoTierCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.first, self.second = self.worker(), self.worker()
+
+    def worker(self, **options):
+        """Бэкенд с собственным L1, как в отдельном процессе."""
+        backend = TwoTierCache('shared', {
+            'OPTIONS': {'SYNC_INTERVAL': 0, 'L1_TIMEOUT': 60, **options}
+        })
+        backend.l1 = L1Store()
+        return backend
+
+    def test_repeat_reads_skip_l2(self):
+        self.first.set('key', {'a': 1})
+        with mock.patch.object(caches['shared'], 'get') as shared_get:
+            shared_get.return_value = None
+            for _ in range(3):
+                self.assertEqual(self.first.get('key'), {'a': 1})
+        # читался только журнал инвалидаций
+        for call in shared_get.call_args_list:
+            self.assertEqual(call[0][0], JOURNAL_SEQ)
+        self.assertEqual(self.first.stats()['hits'], 3)
+
+    def test_writes_reach_other_workers(self):
+        self.first.set('key', 1)
+        self.assertEqual(self.second.get('key'), 1)
+        self.first.set('key', 2)
+        self.assertEqual(self.second.get('key'), 2)
+        self.first.incr('key')
+        self.assertEqual(self.second.get('key'), 3)
+        self.first.delete('key')
+        self.assertIsNone(self.second.get('key'))
+
+    def test_sync_interval(self):
+        lazy = self.worker(SYNC_INTERVAL=60)
+        self.first.set('key', 1)
+        self.assertEqual(lazy.get('key'), 1)
+        self.first.set('key', 2)
+        self.assertEqual(lazy.get('key'), 1)
+        lazy.sync(force=True)
+        self.assertEqual(lazy.get('key'), 2)
+
+    def test_lost_journal_clears_l1(self):
+        self.second.get('key')
+        self.first.set('key', 1)
+        self.second.set('other', 1)
+        self.first.set('key', 2)
+        seq = caches['shared'].get(JOURNAL_SEQ)
+        caches['shared'].delete(JOURNAL_ENTRY.format(seq))
+        self.assertEqual(self.second.get('key'), 2)
+        self.assertEqual(self.second.stats()['size'], 1)
+
+    def test_get_many_batches_l2(self):
+        self.first.set_many({'a': 1, 'b': 2})
+        self.second.get('a')
+        with mock.patch.object(
+            caches['shared'], 'get_many', wraps=caches['shared'].get_many
+        ) as shared_get_many:
+            self.assertEqual(
+                self.second.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2}
+            )
+        shared_get_many.assert_called_once_with(['b', 'c'], version=None)
+        self.first.set_many({'a': 3})
+        self.assertEqual(self.second.get_many(['a']), {'a': 3})
+
+    def test_l2_only_keys_skip_journal(self):
+        first = self.worker(L2_ONLY_PREFIXES=('stats:',))
+        first.add('stats:hits', 0)
+        first.get('stats:hits')
+        seq = caches['shared'].get(JOURNAL_SEQ)
+        for _ in range(3):
+            first.incr('stats:hits')
+        first.delete('stats:lock')
+        self.assertEqual(caches['shared'].get(JOURNAL_SEQ), seq)
+        self.assertEqual(first.get('stats:hits'), 3)
+        self.assertEqual(first.stats()['size'], 0)
+
+    def test_clear_reaches_other_workers(self):
+        self.first.set('key', 1)
+        self.second.get('key')
+        self.first.clear()
+        self.assertIsNone(self.second.get('key'))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_POOL_WORKERS=2)
+class QueuedThumbnailTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(
+            author=cls.user, text='Пост', image='posts/cold.jpg'
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_missing_thumbnail_is_queued_not_rendered(self):
+        """Без готовой миниатюры карточка показывает заглушку,
+        а нарезка уходит в пул один раз."""
+        with mock.patch('posts.tasks.get_executor') as get_executor:
+            response = self.client.get(reverse('posts:index'))
+            cache.clear()
+            self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Картинка готовится')
+        get_executor.return_value.submit.assert_called_once()
+        args = get_executor.return_value.submit.call_args[0][1:]
+        self.assertEqual(args[0][0], 'posts/cold.jpg')
+        self.assertEqual(args[1], '960x339')
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    THUMBNAIL_POOL_WORKERS=0,
+    POST_IMAGE_FORMATS=('webp',)
+)
+class ImageVariantsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_variants_rendered_to_srcset(self):
+        """Варианты режутся не шире исходника и попадают в srcset."""
+        buffer = BytesIO()
+        Image.new('RGB', (1000, 500), 'red').save(buffer, 'PNG')
+        post = Post.objects.create(
+            author=self.user,
+            text='Пост',
+            image=SimpleUploadedFile('wide.png', buffer.getvalue())
+        )
+        queue_post_variants(post)
+        post.refresh_from_db()
+        variants = json.loads(post.image_variants)
+        self.assertEqual([width for width, _ in variants['webp']], [480, 960])
+        with default_storage.open(variants['webp'][0][1]) as file:
+            self.assertEqual(Image.open(file).size, (480, 170))
+        self.assertEqual(post.image_srcsets, [(
+            'image/webp',
+            f'/media/{variants["webp"][0][1]} 480w, '
+            f'/media/{variants["webp"][1][1]} 960w'
+        )])
+
+
+class PageWindowTests(SimpleTestCase):
+    def test_elided_page_range(self):
+        """В окне паджинатора только соседние и крайние страницы."""
+        paginator = PostPaginator(range(50000 * 10), 10)
+        self.assertEqual(
+            list(paginator.get_elided_page_range(25000)),
+            [1, ELLIPSIS, 24998, 24999, 25000, 25001, 25002, ELLIPSIS, 50000]
+        )
+        self.assertEqual(
+            list(paginator.get_elided_page_range(1)),
+            [1, 2, 3, ELLIPSIS, 50000]
+        )
+        small = PostPaginator(range(30), 10)
+        self.assertEqual(list(small.get_elided_page_range(2)), [1, 2, 3])
+
+
+class EstimatedCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        for _ in range(3):
+            Post.objects.create(author=cls.user, group=cls.group, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_post_counter_maintained(self):
+        counter = TableCounter.objects.get(table=Post._meta.db_table)
+        self.assertEqual(counter.rows, Post.objects.count())
+
+    @override_settings(EXACT_COUNT_LIMIT=100)
+    def test_large_unfiltered_feed_uses_estimate(self):
+        """Главная берёт оценку, лента группы считается точно."""
+        TableCounter.objects.filter(
+            table=Post._meta.db_table
+        ).update(rows=1000)
+        response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response.context['page_obj'].paginator.count, 1000)
+        response = self.client.get(
+            reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        )
+        self.assertEqual(response.context['page_obj'].paginator.count, 3)
+
+    def test_small_feed_counted_exactly(self):
+        TableCounter.objects.filter(
+            table=Post._meta.db_table
+        ).update(rows=1000)
+        response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response.context['page_obj'].paginator.count, 3)
+
+
+class PostCursorPaginatorTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test_name')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        Post.objects.bulk_create(
+            Post(text=f'Тестовый текст {i}', author=cls.user, group=cls.group)
+            for i in range(13)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_cursor_pages(self):
+        """Курсорная паджинация: вперёд и назад по токенам."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                first = self.guest_client.get(url + '?cursor=')
+                first_page = first.context['page_obj']
+                self.assertEqual(len(first_page), 10)
+                self.assertFalse(first_page.has_previous())
+                second = self.guest_client.get(
+                    url + f'?cursor={first_page.next_cursor}'
+                )
+                second_page = second.context['page_obj']
+                self.assertEqual(len(second_page), 3)
+                self.assertFalse(second_page.has_next())
+                back = self.guest_client.get(
+                    url + f'?cursor={second_page.previous_cursor}'
+                )
+                self.assertEqual(
+                    list(back.context['page_obj']), list(first_page)
+                )
+
+    def test_broken_cursor_returns_first_page(self):
+        response = self.guest_client.get(
+            reverse('posts:index') + '?cursor=broken'
+        )
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+    def test_forged_cursor_returns_first_page(self):
+        """Самодельные токены с числами и датами вне диапазона не
+        доходят до базы."""
+        date = timezone.now().isoformat()
+        positions = (
+            [date, 1e400, 'n'],
+            [date, 2 ** 64, 'n'],
+            ['9999-12-31T23:59:59-14:00', 1, 'n'],
+        )
+        post = Post.objects.first()
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:post_comments', kwargs={'post_id': post.pk}),
+        )
+        for position in positions:
+            cursor = urlsafe_base64_encode(json.dumps(position).encode())
+            for url in urls:
+                with self.subTest(position=position, url=url):
+                    response = self.guest_client.get(url, {'cursor': cursor})
+                    self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    @override_settings(POST_CURSOR_PAGINATION=True)
+    def test_cursor_mode_by_settings(self):
+        response = self.guest_client.get(reverse('posts:index'))
+        page_obj = response.context['page_obj']
+        self.assertTrue(page_obj.paginator.cursor_mode)
+        self.assertContains(response, f'?cursor={page_obj.next_cursor}')
+
+
+class FeedCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+        )
+
+    def test_feeds_cached_until_write(self):
+        """Ленты берутся из кэша и сбрасываются сразу после записи."""
+        for url in self.urls:
+            self.client.get(url)
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertFalse(view_rendered(self.client.get(url)))
+        Post.objects.create(
+            author=self.user, group=self.group, text='Свежий пост'
+        )
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), 'Свежий пост')
+
+    def test_feed_stats(self):
+        url = reverse('posts:index')
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(
+            feed_stats()['index'], {'hits': 1, 'misses': 1, 'stale': 0}
+        )
+
+    def lock(self, url):
+        # блокировка, которую держал бы запрос в другом воркере
+        request = RequestFactory().get(url)
+        cache.add(_lock_key(_page_key('index', 'shell', request)), 1)
+
+    def test_stale_page_while_other_request_rebuilds(self):
+        url = reverse('posts:index')
+        self.client.get(url)
+        Post.objects.create(author=self.user, text='Свежий пост')
+        self.lock(url)
+        response = self.client.get(url)
+        self.assertFalse(view_rendered(response))
+        self.assertNotContains(response, 'Свежий пост')
+        self.assertEqual(feed_stats()['index']['stale'], 1)
+
+    @override_settings(FEED_LOCK_WAIT=0.1)
+    def test_cold_miss_renders_after_waiting(self):
+        url = reverse('posts:index')
+        self.lock(url)
+        response = self.client.get(url)
+        self.assertTrue(view_rendered(response))
+        self.assertEqual(feed_stats()['index']['misses'], 1)
+
+    def test_early_expiration(self):
+        entry = {'expires': 100, 'delta': 1}
+        with mock.patch('posts.cache.random.random', return_value=0):
+            self.assertTrue(_is_fresh(entry, now=99))
+        with mock.patch('posts.cache.random.random', return_value=0.9):
+            # -ln(0.1) ≈ 2.3 секунды до срока — пора пересчитывать
+            self.assertFalse(_is_fresh(entry, now=99))
+        with mock.patch('posts.cache.random.random', return_value=0):
+            self.assertFalse(_is_fresh(entry, now=100))
+
+    def test_follow_feed_per_user(self):
+        reader = User.objects.create_user(username='reader')
+        Post.objects.create(author=self.user, text='Пост автора')
+        self.client.force_login(reader)
+        url = reverse('posts:follow_index')
+        self.assertNotContains(self.client.get(url), 'Пост автора')
+        self.assertFalse(view_rendered(self.client.get(url)))
+        Follow.objects.create(user=reader, author=self.user)
+        self.assertContains(self.client.get(url), 'Пост автора')
+
+    def test_post_card_fragment_cached_until_card_changes(self):
+        """Карточка поста кэшируется до изменения поста, имени автора
+        или адреса группы."""
+        post = Post.objects.create(
+            author=self.user, group=self.group, text='Пост'
+        )
+        url = reverse('posts:index')
+        self.client.get(url)
+        # update() не меняет post.updated: карточка берётся из кэша
+        Post.objects.filter(pk=post.pk).update(text='Тихая правка')
+        purge_tags('index')
+        self.assertNotContains(self.client.get(url), 'Тихая правка')
+        self.user.first_name = 'Новое'
+        self.user.save()
+        self.assertContains(self.client.get(url), 'Новое')
+        Group.objects.filter(pk=self.group.pk).update(slug='moved')
+        purge_tags('index')
+        self.assertContains(self.client.get(url), '/group/moved/')
+
+    def test_surrogate_keys(self):
+        post = Post.objects.create(
+            author=self.user, group=self.group, text='Пост'
+        )
+        response = self.client.get(self.urls[1])
+        self.assertEqual(
+            set(response[SURROGATE_KEY].split()),
+            {f'group-{self.group.pk}', f'post-{post.pk}',
+             f'author-{self.user.pk}'}
+        )
+        # из кэша — с теми же тегами
+        response = self.client.get(self.urls[1])
+        self.assertFalse(view_rendered(response))
+        self.assertIn(f'post-{post.pk}', response[SURROGATE_KEY])
+
+    def test_moved_post_leaves_old_group(self):
+        """Перенос поста сбрасывает ленты обеих групп."""
+        other = Group.objects.create(title='Другая', slug='other')
+        post = Post.objects.create(
+            author=self.user, group=self.group, text='Переезжающий пост'
+        )
+        other_url = reverse('posts:group_list', kwargs={'slug': other.slug})
+        for url in (*self.urls, other_url):
+            self.client.get(url)
+        self.client.force_login(self.user)
+        self.client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+            {'text': 'Переехавший пост', 'group': other.pk}
+        )
+        self.assertNotContains(self.client.get(self.urls[1]), 'Пере')
+        self.assertContains(self.client.get(other_url), 'Переехавший пост')
+        self.assertContains(self.client.get(self.urls[2]), 'Переехавший')
+
+    def test_unrelated_write_keeps_page(self):
+        """Правка поста не сбрасывает ленту чужой группы."""
+        other = Group.objects.create(title='Другая', slug='other')
+        post = Post.objects.create(author=self.user, group=other, text='Пост')
+        self.client.get(self.urls[1])
+        post.text = 'Правка'
+        post.save()
+        self.assertFalse(view_rendered(self.client.get(self.urls[1])))
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.post = Post.objects.create(
+            author=cls.user, group=cls.group, text='Пост'
+        )
+        cls.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': cls.group.slug}),
+            reverse('posts:profile', kwargs={'username': cls.user.username}),
+            reverse('posts:post_detail', kwargs={'post_id': cls.post.pk}),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_not_modified(self):
+        """Повторный запрос без изменений — 304 без рендера."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertIn('Last-Modified', response)
+                with mock.patch('posts.cache._cached_response') as page:
+                    response = self.revalidate(url, response)
+                page.assert_not_called()
+                self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+                self.assertIn('Cookie', response['Vary'])
+
+    def test_if_modified_since(self):
+        response = self.client.get(self.urls[2])
+        response = self.client.get(
+            self.urls[2], HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_changes_reset_validators(self):
+        first = [self.client.get(url) for url in self.urls]
+        Comment.objects.create(post=self.post, author=self.user, text='К')
+        self.assertEqual(
+            self.revalidate(self.urls[3], first[3]).status_code,
+            HTTPStatus.OK
+        )
+        self.post.text = 'Правка'
+        self.post.save()
+        for url, response in zip(self.urls, first):
+            with self.subTest(url=url):
+                response = self.revalidate(url, response)
+                self.assertContains(response, 'Правка')
+
+    def test_deleted_post_resets_validators(self):
+        post = Post.objects.create(
+            author=self.user, group=self.group, text='Удаляемый'
+        )
+        first = [self.client.get(url) for url in self.urls[:3]]
+        post.delete()
+        for url, response in zip(self.urls, first):
+            with self.subTest(url=url):
+                response = self.revalidate(url, response)
+                self.assertNotContains(response, 'Удаляемый')
+
+    def test_etag_per_user(self):
+        response = self.client.get(self.urls[0])
+        self.client.force_login(self.user)
+        self.assertEqual(
+            self.revalidate(self.urls[0], response).status_code,
+            HTTPStatus.OK
+        )
+
+    def test_following_resets_profile(self):
+        reader = User.objects.create_user(username='reader')
+        self.client.force_login(reader)
+        response = self.client.get(self.urls[2])
+        Follow.objects.create(user=reader, author=self.user)
+        self.assertEqual(
+            self.revalidate(self.urls[2], response).status_code,
+            HTTPStatus.OK
+        )
+
+    def test_stale_page_without_validators(self):
+        self.client.get(self.urls[0])
+        Post.objects.create(author=self.user, text='Свежий пост')
+        request = RequestFactory().get(self.urls[0])
+        cache.add(_lock_key(_page_key('index', 'shell', request)), 1)
+        response = self.client.get(self.urls[0])
+        self.assertNotContains(response, 'Свежий пост')
+        self.assertNotIn('ETag', response)
+
+    def test_missing_object(self):
+        response = self.client.get(
+            reverse('posts:group_list', kwargs={'slug': 'missing'})
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        self.assertNotIn('ETag', response)
+
+
+class PurgeRequestHandler(BaseHTTPRequestHandler):
+    # прокси-заглушка: запоминает теги из PURGE
+    def do_PURGE(self):
+        self.server.purged.append(self.headers[SURROGATE_KEY])
+        self.send_response(HTTPStatus.OK)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class ProxyPurgeTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.proxy = HTTPServer(('127.0.0.1', 0), PurgeRequestHandler)
+        self.proxy.purged = []
+        thread = threading.Thread(target=self.proxy.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.proxy.server_close)
+        self.addCleanup(self.proxy.shutdown)
+        host, port = self.proxy.server_address
+        purge = override_settings(
+            CACHE_PURGE_URLS=[f'http://{host}:{port}/']
+        )
+        purge.enable()
+        self.addCleanup(purge.disable)
+
+    def purged(self):
+        # PURGE шлёт фоновый поток: ждём, пока он разберёт очередь
+        get_thread_executor().submit(int).result()
+        return self.proxy.purged
+
+    def test_post_edit_purges_proxy(self):
+        user = User.objects.create_user(username='author')
+        group = Group.objects.create(title='Группа', slug='group')
+        post = Post.objects.create(author=user, text='Пост')
+        self.purged().clear()
+        post.group = group
+        post.save()
+        self.assertEqual(
+            self.purged(),
+            [f'author-{user.pk} group-{group.pk} index post-{post.pk} search']
+        )
+
+    def test_no_purge_after_rollback(self):
+        user = User.objects.create_user(username='author')
+        self.purged().clear()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Post.objects.create(author=user, text='Пост')
+            raise RuntimeError
+        self.assertEqual(self.purged(), [])
+
+    def test_one_purge_per_transaction(self):
+        user = User.objects.create_user(username='author')
+        post = Post.objects.create(author=user, text='Пост')
+        Comment.objects.bulk_create(
+            Comment(post=post, author=user, text=f'Коммент {i}')
+            for i in range(3)
+        )
+        self.purged().clear()
+        with transaction.atomic():
+            for comment in Comment.objects.all():
+                comment.delete()
+            post.text = 'Правка'
+            post.save()
+        self.assertEqual(
+            self.purged(),
+            [f'author-{user.pk} index post-{post.pk} search']
+        )
+
+
+class PurgeOnCommitTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_render_before_commit_not_kept(self):
+        "Страница, отрисованная до коммита по старым строкам, не остаётся"
+        user = User.objects.create_user(username='author')
+        post = Post.objects.create(author=user, text='Старый текст')
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        with transaction.atomic():
+            # писатель уже сдвинул версии, а чужой рендер ещё видит
+            # строку до правки
+            purge_tags(f'post-{post.pk}')
+            self.assertContains(self.client.get(url), 'Старый текст')
+            Post.objects.filter(pk=post.pk).update(text='Новый текст')
+        self.assertContains(self.client.get(url), 'Новый текст')
+
+
+class CommentPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(author=cls.user, text='Пост')
+
+    def add_comments(self, count):
+        Comment.objects.bulk_create(
+            Comment(post=self.post, author=self.user, text=f'Коммент {i}')
+            for i in range(count)
+        )
+
+    def get_detail(self):
+        # bulk_create обходит сигналы, которые сбрасывают кэш страницы
+        cache.clear()
+        return self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+
+    def test_comment_queries_do_not_grow(self):
+        """Число запросов страницы поста не зависит от комментариев."""
+        self.add_comments(2)
+        with CaptureQueriesContext(connection) as few:
+            self.get_detail()
+        self.add_comments(40)
+        with self.assertNumQueries(len(few)):
+            response = self.get_detail()
+        self.assertEqual(
+            len(response.context['comments']), settings.COMMENT_LIMIT
+        )
+
+    def test_post_detail_queries(self):
+        """Пост со всеми счётчиками — один запрос, комментарии — второй,
+        валидаторы условного GET — третий."""
+        group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        Post.objects.filter(pk=self.post.pk).update(group=group)
+        self.add_comments(3)
+        with self.assertNumQueries(3):
+            response = self.get_detail()
+        post = response.context['post']
+        self.assertEqual(post.comment_count, 3)
+        self.assertEqual(response.context['count'], 1)
+        self.assertContains(response, group.slug)
+
+    def test_load_more_comments(self):
+        """Фрагмент «показать ещё» отдаёт следующую пачку."""
+        self.add_comments(settings.COMMENT_LIMIT + 5)
+        first_page = self.get_detail().context['comments']
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk}),
+            {'cursor': first_page.next_cursor}
+        )
+        second_page = response.context['comments']
+        self.assertEqual(len(second_page), 5)
+        self.assertFalse(second_page.has_next())
+        self.assertTemplateUsed(response, 'includes/comment_list.html')
+
+    def test_comments_of_missing_post(self):
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': 0})
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        cls.cats = Post.objects.create(
+            author=cls.user, text='Пушистые котики спят на пушистом пледе'
+        )
+        cls.code = Post.objects.create(
+            author=cls.user, text='Котик и программирование'
+        )
+        cls.sea = Post.objects.create(author=cls.user, text='Летом на море')
+
+    def search(self, query, **params):
+        return self.client.get(
+            reverse('posts:search'), {'q': query, **params}
+        )
+
+    def test_russian_stemming(self):
+        """Находятся другие формы слова; нужны все слова запроса."""
+        response = self.search('пушистый котик')
+        self.assertEqual(list(response.context['page_obj']), [self.cats])
+        response = self.search('котиков')
+        self.assertCountEqual(
+            response.context['page_obj'], [self.cats, self.code]
+        )
+
+    def test_index_follows_edits_and_deletes(self):
+        self.sea.text = 'Зимой в горах'
+        self.sea.save()
+        self.assertEqual(len(self.search('море').context['page_obj']), 0)
+        self.assertEqual(len(self.search('горы').context['page_obj']), 1)
+        self.sea.delete()
+        self.assertEqual(len(self.search('горы').context['page_obj']), 0)
+
+    @override_settings(POST_LIMIT=1)
+    def test_pagination_keeps_query(self):
+        response = self.search('котик', page=2)
+        # короткий пост релевантнее и стоит первым
+        self.assertEqual(list(response.context['page_obj']), [self.cats])
+        self.assertContains(
+            response, '?q=%D0%BA%D0%BE%D1%82%D0%B8%D0%BA&amp;page=1'
+        )
+
+    def test_api(self):
+        response = self.client.get(
+            reverse('posts:search_api'), {'q': 'программированием'}
+        )
+        data = response.json()
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(data['results'][0]['id'], self.code.pk)
+        self.assertEqual(data['results'][0]['author'], 'author')
+
+    def test_empty_query(self):
+        response = self.search('  ')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+
+class AdminChangelistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin'
+        )
+        cls.groups = [
+            Group.objects.create(
+                title=f'Группа {i}', slug=f'group-{i}', description='Описание'
+            )
+            for i in range(3)
+        ]
+        cls.sea = Post.objects.create(
+            author=cls.admin, text='Летом мы ездили к морю'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def add_posts(self, count):
+        Post.objects.bulk_create(
+            Post(
+                author=self.admin,
+                group=self.groups[i % len(self.groups)],
+                text=f'Пост {i}',
+            )
+            for i in range(count)
+        )
+
+    def changelist(self, model='post', **params):
+        return self.client.get(
+            reverse(f'admin:posts_{model}_changelist'), params
+        )
+
+    def test_queries_do_not_grow(self):
+        """Группы, авторы и выпадающие списки не запрашиваются по строкам."""
+        self.add_posts(2)
+        self.changelist()
+        with CaptureQueriesContext(connection) as few:
+            self.changelist()
+        self.add_posts(40)
+        with self.assertNumQueries(len(few)):
+            response = self.changelist()
+        self.assertContains(response, 'Группа 2')
+
+    def test_group_choices_follow_changes(self):
+        self.changelist()
+        Group.objects.create(title='Новая', slug='new', description='')
+        self.assertContains(self.changelist(), 'Новая')
+
+    @override_settings(EXACT_COUNT_LIMIT=10)
+    def test_estimated_count(self):
+        self.add_posts(20)
+        TableCounter.objects.filter(table=Post._meta.db_table).update(
+            rows=1000
+        )
+        response = self.changelist()
+        self.assertEqual(response.context['cl'].result_count, 1000)
+
+    def test_search_uses_index(self):
+        self.add_posts(5)
+        response = self.changelist(q='моря')
+        self.assertEqual(list(response.context['cl'].result_list), [self.sea])
+
+    def test_date_hierarchy(self):
+        now = timezone.localtime()
+        response = self.changelist()
+        self.assertContains(response, f'pub_date__year={now.year}')
+        response = self.changelist(
+            pub_date__year=now.year, pub_date__month=now.month
+        )
+        self.assertContains(response, f'pub_date__day={now.day}')
+
+    def test_comment_changelist(self):
+        Comment.objects.create(
+            post=self.sea, author=self.admin, text='Комментарий'
+        )
+        response = self.changelist('comment', q='admin')
+        self.assertEqual(len(response.context['cl'].result_list), 1)
+        response = self.changelist('comment', q='adm')
+        self.assertEqual(len(response.context['cl'].result_list), 0)
+
+    def test_delete_is_queued(self):
+        """Удаление из админки ставится в очередь, а не выполняется."""
+        group = self.groups[0]
+        response = self.client.post(
+            reverse('admin:posts_group_delete', args=(group.pk,)),
+            {'post': 'yes'}
+        )
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        job = DeletionJob.objects.get()
+        self.assertEqual(job.object_id, group.pk)
+        self.assertEqual(job.status, DeletionJob.PENDING)
+        # задание стартует после коммита, которого в TestCase нет
+        self.assertTrue(Group.objects.filter(pk=group.pk).exists())
+        self.assertEqual(
+            [str(message) for message in get_messages(response.wsgi_request)],
+            [f'Удаление «{group}» поставлено в очередь.']
+        )
+
+    def test_delete_selected_is_queued(self):
+        url = reverse('admin:posts_group_changelist')
+        data = {
+            'action': 'delete_selected',
+            '_selected_action': [group.pk for group in self.groups[:2]],
+        }
+        response = self.client.post(url, data)
+        self.assertContains(response, 'Группа 1')
+        response = self.client.post(url, {**data, 'post': 'yes'})
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        self.assertEqual(DeletionJob.objects.count(), 2)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(
+            [str(message) for message in get_messages(response.wsgi_request)],
+            ['Удаление объектов (2) поставлено в очередь.']
+        )
+
+    def test_delete_needs_dependent_permissions(self):
+        """Для удаления пользователя нужны права на его посты,
+        комментарии и подписки."""
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        staff.user_permissions.add(*Permission.objects.filter(
+            codename__in=('view_user', 'delete_user')
+        ))
+        self.client.force_login(staff)
+        url = reverse('admin:auth_user_delete', args=(self.admin.pk,))
+        response = self.client.get(url)
+        self.assertEqual(
+            set(response.context['perms_lacking']),
+            {'Публикация', 'Комментарий', 'Подписка'}
+        )
+
+
+class PageShellTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def test_logged_in_users_share_guest_shell(self):
+        url = reverse('posts:index')
+        self.assertContains(self.client.get(url), 'Войти')
+        response = self.reader_client.get(url)
+        self.assertFalse(view_rendered(response))
+        self.assertContains(response, 'Пользователь: reader')
+        self.assertNotContains(response, 'Войти')
+        self.assertNotContains(response, '<!--hole:')
+        self.assertIn('Cookie', response['Vary'])
+
+    def test_switcher_per_user(self):
+        """Вкладки лент не попадают в оболочку ни от гостя, ни от
+        вошедшего."""
+        url = reverse('posts:index')
+        follow_url = reverse('posts:follow_index')
+        for first, second, tabs in (
+            (self.client, self.reader_client, True),
+            (self.reader_client, self.client, False),
+        ):
+            with self.subTest(tabs=tabs):
+                cache.clear()
+                first.get(url)
+                response = second.get(url)
+                self.assertFalse(view_rendered(response))
+                if tabs:
+                    self.assertContains(response, follow_url)
+                else:
+                    self.assertNotContains(response, follow_url)
+
+    def test_follow_button(self):
+        url = reverse('posts:profile', kwargs={'username': 'author'})
+        self.assertNotContains(self.author_client.get(url), 'Подписаться')
+        self.assertContains(self.reader_client.get(url), 'Подписаться')
+        # bulk_create обходит сигналы: страница остаётся в кэше
+        Follow.objects.bulk_create(
+            [Follow(user=self.reader, author=self.author)]
+        )
+        response = self.reader_client.get(url)
+        self.assertFalse(view_rendered(response))
+        self.assertContains(response, 'Отписаться')
+
+    def test_post_detail_parts(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        edit_url = reverse('posts:post_edit', kwargs={'post_id': self.post.pk})
+        guest = self.client.get(url)
+        self.assertNotContains(guest, edit_url)
+        self.assertNotContains(guest, 'Добавить комментарий')
+        reader = self.reader_client.get(url)
+        self.assertNotIn('post', reader.context)
+        self.assertNotContains(reader, edit_url)
+        self.assertContains(reader, 'Добавить комментарий')
+        self.assertContains(reader, 'csrfmiddlewaretoken')
+        self.assertContains(self.author_client.get(url), edit_url)
+
+    def test_comment_resets_post_page(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        self.client.get(url)
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Первый!'
+        )
+        self.assertContains(self.client.get(url), 'Первый!')
+
+    def test_forged_hole_dropped(self):
+        request = RequestFactory().get('/')
+        request.user = self.reader
+        marker = hole_marker(
+            'edit_button', {'post_id': 1, 'author_id': self.reader.pk}
+        )
+        self.assertIn('/posts/1/edit/', fill_holes(request, marker))
+        # подпись не сходится с содержимым
+        signature = marker[-8:-3]
+        forged = marker.replace(signature, signature[::-1].swapcase())
+        self.assertEqual(fill_holes(request, f'<p>{forged}</p>'), '<p></p>')
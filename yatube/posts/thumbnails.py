@@ -0,0 +1,127 @@
+"""Миниатюры постов режутся в пуле процессов, а не в потоке запроса."""
+from django.conf import settings
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.helpers import get_module_class
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+
+from .images import refresh_posts
+from .storage import image_storage
+from .tasks import run_in_pool
+
+
+class QueuedThumbnailBackend(ThumbnailBackend):
+    """Отдаёт только готовые миниатюры из KV-хранилища sorl.
+
+    Если миниатюры ещё нет, ставит её в очередь и возвращает None —
+    тег {% thumbnail %} тогда выводит блок {% empty %} с заглушкой.
+    """
+
+    def prepare_options(self, source, options):
+        # те же умолчания, что в ThumbnailBackend.get_thumbnail
+        options = dict(options)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        return options
+
+    def get_thumbnail_file(self, source, geometry_string, options):
+        name = self._get_thumbnail_filename(
+            source, geometry_string, self.prepare_options(source, options)
+        )
+        return ImageFile(name, default.storage)
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if not file_:
+            raise ValueError('falsey file_ argument in get_thumbnail()')
+        source = ImageFile(file_)
+        thumbnail = self.get_thumbnail_file(source, geometry_string, options)
+        cached = default.kvstore.get(thumbnail)
+        if cached:
+            return cached
+        queue_thumbnail(source, geometry_string, options)
+        # без пула миниатюра уже готова, с пулом здесь будет None
+        return default.kvstore.get(thumbnail)
+
+    def render(self, source, geometry_string, options):
+        """Режет миниатюру и возвращает сериализованные исходник и результат.
+
+        В KV-хранилище ничего не пишет: это делает процесс-родитель.
+        """
+        # хранилище исходника входит в имя миниатюры, поэтому исходник
+        # приходит парой (имя, путь к классу хранилища)
+        name, storage = source
+        source = ImageFile(name, get_module_class(storage)())
+        thumbnail = self.get_thumbnail_file(source, geometry_string, options)
+        options = self.prepare_options(source, options)
+        source_image = default.engine.get_image(source)
+        try:
+            source.set_size(default.engine.get_image_size(source_image))
+            if not thumbnail.exists():
+                options['image_info'] = default.engine.get_image_info(
+                    source_image
+                )
+                self._create_thumbnail(
+                    source_image, geometry_string, options, thumbnail
+                )
+                self._create_alternative_resolutions(
+                    source_image, geometry_string, options, thumbnail.name
+                )
+        finally:
+            default.engine.cleanup(source_image)
+        return source.serialize(), thumbnail.serialize()
+
+
+def render_thumbnail(source, geometry_string, options):
+    return default.backend.render(source, geometry_string, options)
+
+
+def store_thumbnail(result):
+    """Записывает готовую миниатюру и обновляет показывавшие заглушку
+    карточки и ленты."""
+    source = deserialize_image_file(result[0])
+    thumbnail = deserialize_image_file(result[1])
+    default.kvstore.get_or_set(source)
+    default.kvstore.set(thumbnail, source)
+    refresh_posts(source.name)
+
+
+def queue_thumbnail(source, geometry_string, options):
+    """Ставит нарезку миниатюры в фоновый пул."""
+    run_in_pool(
+        (
+            'thumbnail',
+            source.name,
+            geometry_string,
+            tuple(sorted(options.items()))
+        ),
+        render_thumbnail,
+        (
+            (source.name, source.serialize_storage()),
+            geometry_string,
+            options
+        ),
+        store_thumbnail
+    )
+
+
+def queue_post_thumbnails(post):
+    """Ставит в очередь все ещё не нарезанные размеры миниатюр поста."""
+    if not post.image:
+        return
+    for geometry_string, options in settings.POST_THUMBNAILS:
+        default.backend.get_thumbnail(post.image, geometry_string, **options)
+
+
+def forget_thumbnails(name):
+    """Убирает прежнюю картинку поста и её миниатюры из LRU процесса."""
+    forget = getattr(default.kvstore, 'forget', None)
+    if name and forget is not None:
+        forget(ImageFile(name, image_storage))
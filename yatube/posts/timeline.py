@@ -0,0 +1,170 @@
+import logging
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+
+from .models import AuthorStats, Follow, Post, TimelineEntry
+from .tasks import run_in_pool
+
+logger = logging.getLogger(__name__)
+
+
+def is_popular(author_id):
+    """Посты популярных авторов не раскладываются по лентам."""
+    return AuthorStats.objects.filter(
+        user_id=author_id,
+        followers_count__gt=settings.TIMELINE_FANOUT_LIMIT
+    ).exists()
+
+
+def fan_out(post):
+    """Кладёт новый пост в ленты подписчиков автора."""
+    if is_popular(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id,
+                author_id=post.author_id,
+                post_id=post.pk,
+                pub_date=post.pub_date
+            )
+            for user_id in followers.iterator()
+        ),
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def backfill(follow):
+    """Добавляет в ленту подписчика последние посты автора; более
+    старые, чем TIMELINE_BACKFILL_LIMIT последних, в ленту не попадают
+    и видны только в профиле автора."""
+    if is_popular(follow.author_id):
+        return
+    posts = Post.objects.filter(
+        author_id=follow.author_id
+    ).values_list('pk', 'pub_date')[:settings.TIMELINE_BACKFILL_LIMIT]
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=follow.user_id,
+                author_id=follow.author_id,
+                post_id=post_id,
+                pub_date=pub_date
+            )
+            for post_id, pub_date in posts
+        ),
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def refill(author_id):
+    """Раскладывает последние посты автора по лентам всех подписчиков.
+
+    Пока автор был популярным, его посты в ленты не попадали; после
+    того как подписчиков стало не больше порога, ленты читаются только
+    из записей. Записи вставляются пачками, не собираясь в память
+    целиком.
+    """
+    if is_popular(author_id):
+        return 0
+    posts = list(
+        Post.objects.filter(
+            author_id=author_id
+        ).values_list('pk', 'pub_date')[:settings.TIMELINE_BACKFILL_LIMIT]
+    )
+    followers = Follow.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True)
+    entries = (
+        TimelineEntry(
+            user_id=user_id,
+            author_id=author_id,
+            post_id=post_id,
+            pub_date=pub_date
+        )
+        for user_id in followers.iterator()
+        for post_id, pub_date in posts
+    )
+    total = 0
+    while True:
+        batch = list(islice(entries, settings.TIMELINE_BATCH_SIZE))
+        if not batch:
+            return total
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+        total += len(batch)
+
+
+def _refilled(total):
+    logger.info('В ленты разложено %s записей', total)
+
+
+def refill_if_unpopular(author_id):
+    """После отписки: если подписчиков стало ровно столько, сколько
+    позволяет порог, автор только что перестал быть популярным, и его
+    посты раскладываются по лентам в фоне после коммита."""
+    crossed = AuthorStats.objects.filter(
+        user_id=author_id,
+        followers_count=settings.TIMELINE_FANOUT_LIMIT
+    ).exists()
+    if crossed:
+        transaction.on_commit(lambda: run_in_pool(
+            f'refill:{author_id}', refill, (author_id,), _refilled,
+            pool='jobs'
+        ))
+
+
+def prune(follow):
+    """Убирает из ленты посты автора после отписки."""
+    TimelineEntry.objects.filter(
+        user_id=follow.user_id,
+        author_id=follow.author_id
+    ).delete()
+
+
+def popular_authors(user):
+    """Популярные авторы из подписок: их посты читаются при запросе."""
+    return list(
+        Follow.objects.filter(
+            user=user,
+            author__stats__followers_count__gt=settings.TIMELINE_FANOUT_LIMIT
+        ).values_list('author_id', flat=True)
+    )
+
+
+def timeline_posts(user, popular=None):
+    """Лента подписок: материализованные записи и популярные авторы.
+
+    Посты отсортированы по аннотации feed_date. Без популярных авторов
+    это дата из записи ленты, и страница читается одним проходом по
+    индексу (user, -pub_date) записей. Посты популярных авторов в
+    ленты не раскладываются, поэтому с ними выборка объединяется
+    условием и сортируется по дате поста.
+    """
+    if popular is None:
+        popular = popular_authors(user)
+    if not popular:
+        posts = Post.objects.filter(timeline_entries__user=user).annotate(
+            feed_date=F('timeline_entries__pub_date')
+        )
+    else:
+        entries = TimelineEntry.objects.filter(user=user).values('post_id')
+        posts = Post.objects.filter(
+            Q(pk__in=entries) | Q(author_id__in=popular)
+        ).annotate(feed_date=F('pub_date'))
+    return posts.order_by('-feed_date', '-pk')
+
+
+def timeline_count(user, popular):
+    """Число постов ленты по индексу записей, без JOIN постов; с
+    популярными авторами None — паджинатор посчитает выборку сам."""
+    if popular:
+        return None
+    return TimelineEntry.objects.filter(user=user).count()
@@ -0,0 +1,116 @@
+"""Приём загруженных картинок без полного декодирования больших файлов."""
+import hashlib
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import InMemoryUploadedFile
+from PIL import Image, ImageOps
+
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 90, 'optimize': True},
+    'WEBP': {'quality': 90},
+    'PNG': {'optimize': True},
+}
+
+
+EMPTY_IMAGE_METADATA = {
+    'image_width': None,
+    'image_height': None,
+    'image_size': None,
+    'image_format': '',
+    'image_hash': '',
+}
+
+
+def image_metadata(file):
+    """Размеры, вес, формат и SHA-256 картинки — по заголовку и потоку
+    байтов, без декодирования пикселей."""
+    file.seek(0)
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in file.chunks():
+        digest.update(chunk)
+        size += len(chunk)
+    file.seek(0)
+    with Image.open(file) as image:
+        width, height = image.size
+        image_format = image.format or ''
+    file.seek(0)
+    return {
+        'image_width': width,
+        'image_height': height,
+        'image_size': size,
+        'image_format': image_format.lower(),
+        'image_hash': digest.hexdigest(),
+    }
+
+
+def _fit(size, max_side):
+    width, height = size
+    scale = min(1, max_side / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def ingest_image(upload):
+    """Проверяет загруженную картинку по заголовку и при необходимости
+    уменьшает её и вырезает EXIF.
+
+    Пиксели не декодируются, пока размеры не проверены; JPEG
+    декодируется сразу в уменьшенном виде (draft), поэтому пиковая
+    память ограничена POST_IMAGE_MAX_DECODE_PIXELS, а не размером фото.
+    """
+    if upload.size > settings.POST_IMAGE_MAX_UPLOAD_SIZE:
+        raise ValidationError(
+            'Файл больше %(limit)d МБ.',
+            code='file_too_large',
+            params={'limit': settings.POST_IMAGE_MAX_UPLOAD_SIZE // 2 ** 20}
+        )
+    upload.seek(0)
+    # Image.open читает только заголовок
+    with Image.open(upload) as image:
+        width, height = image.size
+        if width * height > settings.POST_IMAGE_MAX_PIXELS:
+            raise ValidationError(
+                'Картинка больше %(limit)d мегапикселей.',
+                code='too_many_pixels',
+                params={'limit': settings.POST_IMAGE_MAX_PIXELS // 10 ** 6}
+            )
+        target = _fit(image.size, settings.POST_IMAGE_MAX_SIDE)
+        if target == image.size and 'exif' not in image.info:
+            upload.seek(0)
+            return upload
+        image_format = image.format
+        # JPEG декодирует сразу в 1/2, 1/4 или 1/8 размера
+        image.draft(None, target)
+        if image.width * image.height > settings.POST_IMAGE_MAX_DECODE_PIXELS:
+            raise ValidationError(
+                'Картинка слишком большая для обработки, '
+                'уменьшите её до %(side)d пикселей по большей стороне.',
+                code='too_many_pixels',
+                params={'side': settings.POST_IMAGE_MAX_SIDE}
+            )
+        icc_profile = image.info.get('icc_profile')
+        # у анимаций остаётся только первый кадр
+        image.thumbnail(
+            (settings.POST_IMAGE_MAX_SIDE, settings.POST_IMAGE_MAX_SIDE),
+            Image.LANCZOS
+        )
+        # поворот по EXIF — уже на уменьшенной копии
+        image = ImageOps.exif_transpose(image)
+    buffer = BytesIO()
+    options = dict(SAVE_OPTIONS.get(image_format, {}))
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    # EXIF не передаётся и в файл не попадает
+    image.save(buffer, image_format, **options)
+    size = buffer.tell()
+    buffer.seek(0)
+    return InMemoryUploadedFile(
+        buffer,
+        getattr(upload, 'field_name', None),
+        upload.name,
+        upload.content_type,
+        size,
+        None
+    )
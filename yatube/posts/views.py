@@ -1,36 +1,79 @@
+from functools import partial
+from urllib.parse import urlencode
+
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.db import transaction
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
-from django.views.decorators.cache import cache_page
 
+from . import queries
+from .cache import add_cache_tags, add_post_tags, cached_feed, post_tags
+from .conditional import (conditional_page, group_state, index_state,
+                          post_state, profile_state)
+from .counters import get_stats
 from .forms import CommentForm, PostForm
+from .images import queue_post_variants
 from .models import Follow, Group, Post, User
+from .paginators import (CursorPaginator, EstimatedCountPaginator,
+                         PostPaginator)
+from .search import search_posts
+from .thumbnails import forget_thumbnails, queue_post_thumbnails
+from .timeline import popular_authors, timeline_count
+
 
+def make_pages(request, post_list, count=None, field='pub_date'):
+    # функция-паджинатор; count — заранее известное число записей,
+    # field — дата, по которой листает курсор
+    if settings.POST_CURSOR_PAGINATION or 'cursor' in request.GET:
+        paginator = CursorPaginator(post_list, settings.POST_LIMIT, field)
+        return paginator.get_cursor_page(request.GET.get('cursor'))
+    paginator = EstimatedCountPaginator(post_list, settings.POST_LIMIT)
+    if count is not None:
+        paginator.count = count
+    return make_numbered_page(request, paginator)
 
-def make_pages(request, post_list):
-    # функция-паджинатор
-    page_number = request.GET.get('page')
-    paginator = Paginator(post_list, settings.POST_LIMIT)
-    return paginator.get_page(page_number)
 
+def make_numbered_page(request, paginator):
+    page_obj = paginator.get_page(request.GET.get('page'))
+    page_obj.page_window = list(paginator.get_elided_page_range(
+        page_obj.number, on_each_side=settings.PAGE_WINDOW
+    ))
+    return page_obj
 
-@cache_page(20)
+
+def make_comment_pages(request, post_id):
+    # комментарии листаются курсором по дате
+    paginator = CursorPaginator(
+        queries.post_comments(post_id),
+        settings.COMMENT_LIMIT,
+        field='created'
+    )
+    return paginator.get_cursor_page(request.GET.get('cursor'))
+
+
+@conditional_page(index_state)
+@cached_feed('index')
 def index(request):
-    post_list = Post.objects.select_related('group', 'author')
-    page_obj = make_pages(request, post_list)
+    # теги — до чтения постов: запись во время рендера сбросит страницу
+    add_cache_tags(request, 'index')
+    page_obj = make_pages(request, queries.index_posts())
+    add_post_tags(request, page_obj)
     context = {
         'page_obj': page_obj,
     }
     return render(request, 'posts/index.html', context)
 
 
+@conditional_page(group_state)
+@cached_feed('group')
 def group_posts(request, slug):
     template = 'posts/group_list.html'
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.select_related('group', 'author')
-    page_obj = make_pages(request, posts)
+    add_cache_tags(request, f'group-{group.pk}')
+    page_obj = make_pages(request, queries.group_posts(group))
+    add_post_tags(request, page_obj)
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -38,38 +81,99 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+@conditional_page(profile_state)
+@cached_feed('profile')
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts_list = Post.objects.select_related('author').filter(author=author)
-    page_obj = make_pages(request, posts_list)
-    following = False
-    if request.user.is_authenticated:
-        following = Follow.objects.filter(
-            user=request.user, author=author
-        ).exists()
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+    add_cache_tags(request, f'author-{author.pk}')
+    postscount = get_stats(author).posts_count
+    page_obj = make_pages(
+        request, queries.profile_posts(author), count=postscount
+    )
+    add_post_tags(request, page_obj)
+    # кнопка подписки — фрагмент, см. posts.fragments
     context = {'author': author,
-               'postscount': posts_list.count(),
+               'postscount': postscount,
                'page_obj': page_obj,
-               'following': following
                }
     return render(request, 'posts/profile.html', context)
 
 
+@conditional_page(post_state)
+@cached_feed('post')
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    count = Post.objects.filter(author=post.author).count()
-    form = CommentForm()
-    comments_list = post.comments.all()
+    add_cache_tags(request, f'post-{post_id}')
+    post = get_object_or_404(queries.post_with_counts(), pk=post_id)
+    add_cache_tags(request, *post_tags(post))
+    count = get_stats(post.author).posts_count
+    comments_list = make_comment_pages(request, post.pk)
     context = {
         'post': post,
         'count': count,
-        'form': form,
         'comments': comments_list,
 
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_comments(request, post_id):
+    if not Post.objects.filter(pk=post_id).exists():
+        raise Http404('Пост не найден')
+    context = {
+        'post_id': post_id,
+        'comments': make_comment_pages(request, post_id),
+    }
+    return render(request, 'includes/comment_list.html', context)
+
+
+def search_page(request):
+    # порядок задаёт релевантность, поэтому курсор по дате не подходит
+    query = request.GET.get('q', '').strip()
+    posts = search_posts(query).select_related('author', 'group')
+    paginator = PostPaginator(posts, settings.POST_LIMIT)
+    return query, make_numbered_page(request, paginator)
+
+
+@cached_feed('search')
+def search(request):
+    add_cache_tags(request, 'search')
+    query, page_obj = search_page(request)
+    add_post_tags(request, page_obj)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'page_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@cached_feed('search')
+def search_api(request):
+    add_cache_tags(request, 'search')
+    query, page_obj = search_page(request)
+    add_post_tags(request, page_obj)
+    return JsonResponse({
+        'query': query,
+        'count': page_obj.paginator.count,
+        'page': page_obj.number,
+        'num_pages': page_obj.paginator.num_pages,
+        'results': [
+            {
+                'id': post.pk,
+                'text': post.text,
+                'author': post.author.username,
+                'group': post.group.slug if post.group else None,
+                'pub_date': post.pub_date.isoformat(),
+                'url': reverse('posts:post_detail', args=(post.pk,)),
+                'rank': post.rank,
+            }
+            for post in page_obj
+        ],
+    }, json_dumps_params={'ensure_ascii': False})
+
+
 @login_required
 def post_create(request):
     form = PostForm(
@@ -81,6 +185,8 @@ def post_create(request):
             post = form.save(commit=False)
             post.author = request.user
             post.save()
+            transaction.on_commit(partial(queue_post_thumbnails, post))
+            transaction.on_commit(partial(queue_post_variants, post))
             return redirect('posts:profile', post.author)
     return render(request, 'posts/create_post.html', {'form': form})
 
@@ -91,6 +197,7 @@ def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     if request.user != post.author:
         return redirect('posts:post_detail', post.pk)
+    old_image = post.image.name if post.image else ''
     form = PostForm(
         request.POST or None,
         files=request.FILES or None,
@@ -98,7 +205,14 @@ def post_edit(request, post_id):
     )
     if request.method == 'POST':
         if form.is_valid():
+            if 'image' in form.changed_data:
+                # старые варианты относятся к прежней картинке
+                post.image_variants = ''
             form.save()
+            if 'image' in form.changed_data:
+                transaction.on_commit(partial(forget_thumbnails, old_image))
+                transaction.on_commit(partial(queue_post_thumbnails, post))
+                transaction.on_commit(partial(queue_post_variants, post))
         return redirect('posts:post_detail', post_id)
     context = {'form': form, 'is_edit': True, 'post': post}
     return render(request, template, context)
@@ -117,14 +231,19 @@ def add_comment(request, post_id):
 
 
 @login_required
+@cached_feed(
+    'follow', per_user=True, timeout=settings.FOLLOW_FEED_CACHE_TIMEOUT
+)
 def follow_index(request):
-    posts_followings = Post.objects.filter(
-        author__following__user=request.user
-    )
+    add_cache_tags(request, f'follow-{request.user.pk}')
+    popular = popular_authors(request.user)
     page_obj = make_pages(
         request,
-        posts_followings
+        queries.follow_posts(request.user, popular),
+        count=timeline_count(request.user, popular),
+        field='feed_date'
     )
+    add_post_tags(request, page_obj)
     context = {
         'page_obj': page_obj
     }
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 
 from dotenv import load_dotenv
 import sentry_sdk
@@ -75,6 +76,60 @@ TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 
 # глобальные константы
 POST_LIMIT = 10
+COMMENT_LIMIT = 20
+# сколько номеров страниц показывать по обе стороны от текущей
+PAGE_WINDOW = 2
+# начиная с какого размера нефильтрованная лента считается по оценке
+EXACT_COUNT_LIMIT = 10000
+
+# миниатюры режутся в пуле процессов; 0 — сразу в запросе (разработка)
+THUMBNAIL_BACKEND = 'posts.thumbnails.QueuedThumbnailBackend'
+THUMBNAIL_POOL_WORKERS = int(os.getenv('THUMBNAIL_POOL_WORKERS', 2))
+# отдельный пул для заданий удаления, чтобы не занимать пул миниатюр
+JOB_POOL_WORKERS = int(os.getenv('JOB_POOL_WORKERS', 1))
+# LRU ключей миниатюр в памяти процесса перед кэшем и базой sorl
+THUMBNAIL_KVSTORE = 'posts.kvstore.LRUKVStore'
+THUMBNAIL_LRU_SIZE = 2048
+THUMBNAIL_LRU_TIMEOUT = 60 * 5
+# все размеры, которые используют шаблоны
+POST_THUMBNAILS = (
+    ('960x339', {'crop': 'center', 'upscale': True}),
+)
+# адаптивные варианты картинок постов для <picture>/srcset
+POST_IMAGE_WIDTHS = (480, 960, 1440)
+POST_IMAGE_FORMATS = ('avif', 'webp')
+POST_IMAGE_ASPECT = (960, 339)
+POST_IMAGE_QUALITY = 75
+# приём загрузок: больше MAX_SIDE уменьшается, больше MAX_PIXELS —
+# отказ по заголовку; DECODE_PIXELS ограничивает память на декодирование
+POST_IMAGE_MAX_UPLOAD_SIZE = 30 * 1024 * 1024
+POST_IMAGE_MAX_SIDE = 2560
+POST_IMAGE_MAX_PIXELS = 100_000_000
+POST_IMAGE_MAX_DECODE_PIXELS = 16_000_000
+# курсорная паджинация лент вместо ?page= (без COUNT и OFFSET)
+POST_CURSOR_PAGINATION = False
+# лента подписок: сколько подписчиков у автора, пока посты раскладываются
+# по лентам при публикации; сверх лимита посты читаются при запросе
+TIMELINE_FANOUT_LIMIT = 1000
+# при подписке в ленту попадают столько последних постов автора, более
+# старые видны только в его профиле
+TIMELINE_BACKFILL_LIMIT = 500
+TIMELINE_BATCH_SIZE = 500
+# страницы лент сбрасываются по тегам из сигналов, поэтому живут долго
+FEED_CACHE_TIMEOUT = 60 * 60 * 6
+# ленту подписок новые посты авторов не сбрасывают: живёт недолго
+FOLLOW_FEED_CACHE_TIMEOUT = 20
+# устаревшую страницу пересчитывает один запрос (блокировка на
+# FEED_LOCK_TIMEOUT), остальные столько ещё получают старую; без неё
+# ждут чужой пересчёт до FEED_LOCK_WAIT секунд
+FEED_STALE_TIMEOUT = 60 * 10
+FEED_LOCK_TIMEOUT = 10
+FEED_LOCK_WAIT = 2
+# больше — раньше начинается вероятностный пересчёт до срока
+FEED_EARLY_BETA = 1.0
+# пользователи, группы и посты из админки удаляются фоном, по стольку
+# зависимых строк за транзакцию (пул — тот же, что у миниатюр)
+DELETION_BATCH_SIZE = 500
 
 
 TEMPLATES = [
@@ -130,11 +185,41 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# L1 в памяти процесса перед общим для воркеров L2 (posts.cache_backend).
+# L2 в проде — memcached (SHARED_CACHE_BACKEND=django.core.cache.backends.
+# memcached.MemcachedCache, SHARED_CACHE_LOCATION=host:11211), локально
+# и в тестах — файловый кэш во временном каталоге
+SHARED_CACHE_BACKEND = os.getenv(
+    'SHARED_CACHE_BACKEND',
+    'django.core.cache.backends.filebased.FileBasedCache'
+)
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'posts.cache_backend.TwoTierCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'L1_TIMEOUT': 5,
+            'L1_MAX_ENTRIES': 500,
+            'SYNC_INTERVAL': 1,
+            # статистика лент и блокировки пересчёта
+            'L2_ONLY_PREFIXES': ('feed-stats:', 'feed-lock:'),
+        },
+    },
+    'shared': {
+        'BACKEND': SHARED_CACHE_BACKEND,
+        'LOCATION': os.getenv(
+            'SHARED_CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'yatube-cache')
+        ),
+    },
 }
+if SHARED_CACHE_BACKEND.endswith('FileBasedCache'):
+    CACHES['shared']['OPTIONS'] = {'MAX_ENTRIES': 10000}
+# прокси перед сайтом (Varnish, Fastly): страницы уходят с заголовком
+# Surrogate-Key, и на эти адреса шлётся PURGE с тегами изменённых
+# объектов; адреса через пробел
+CACHE_PURGE_URLS = os.getenv('CACHE_PURGE_URLS', '').split()
+CACHE_PURGE_TIMEOUT = 2
 
 # Internationalization
 # https://docs.djangoproject.com/en/2.2/topics/i18n/